@@ -1,50 +1,167 @@
+import os
+import threading
+
 import yaml
+from yaml.constructor import SafeConstructor
+
+# 优先使用 LibYAML 提供的 C 加载器，未安装时回退到纯 Python 实现
+try:
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
+
+# 标记配置项不存在
+_MISSING = object()
+
+# 已解析（compose）的配置文件节点树缓存，键为 (路径, 文件大小, 修改时间)
+_PARSE_CACHE = {}
+_PARSE_CACHE_LOCK = threading.Lock()
+
+
+def compose_yaml_file(path):
+    """
+    解析YAML文件为节点树（不构造Python对象），文件未变化时直接返回缓存结果
+
+    Args:
+        path (str): YAML文件路径
+
+    Returns:
+        yaml.Node: 根节点，空文件返回None
+    """
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    try:
+        return _PARSE_CACHE[key]
+    except KeyError:
+        pass
+    with open(path, "r", encoding="utf-8") as f:
+        node = yaml.compose(f, Loader=YamlLoader)
+    # 同一文件只保留最新版本的解析结果（Web 请求与后台任务线程可能同时加载）
+    with _PARSE_CACHE_LOCK:
+        for stale in [k for k in _PARSE_CACHE if k[0] == key[0]]:
+            del _PARSE_CACHE[stale]
+        _PARSE_CACHE[key] = node
+    return node
+
+
+def construct_yaml_node(node):
+    """
+    将节点树构造为Python对象
+
+    Args:
+        node (yaml.Node): YAML节点
+
+    Returns:
+        构造出的Python对象
+    """
+    if node is None:
+        return None
+    return SafeConstructor().construct_document(node)
+
+
+def load_yaml_file(path):
+    """
+    加载YAML文件
+
+    Args:
+        path (str): YAML文件路径
+
+    Returns:
+        dict: 解析后的内容
+    """
+    return construct_yaml_node(compose_yaml_file(path))
 
 
 class ConfigManager:
     """
     配置管理器，负责加载、解析和提供应用配置
+
+    顶层配置段在首次访问时才构造为Python对象
     """
     def __init__(self, config_file="config.yaml"):
         """
         初始化配置管理器
-        
+
         Args:
             config_file (str): 配置文件路径
         """
         self.config_file = config_file
-        self.config = self._load_config()
-        
+        self._section_nodes = self._load_config()
+        # 已构造的顶层配置段
+        self._section_cache = {}
+        self._config = None
+        # 点号键名查询结果缓存（配置加载后不再变化）
+        self._get_cache = {}
+
     def _load_config(self):
         """
-        加载配置文件
-        
+        加载配置文件，只建立顶层键到节点的索引
+
+        Returns:
+            dict: 顶层键名到YAML节点的映射
+        """
+        root = compose_yaml_file(self.config_file)
+        if not isinstance(root, yaml.MappingNode):
+            return {}
+        SafeConstructor().flatten_mapping(root)
+        return {key_node.value: value_node for key_node, value_node in root.value}
+
+    def _get_section(self, name):
+        """
+        获取顶层配置段，首次访问时构造
+
+        Args:
+            name (str): 顶层键名
+
+        Returns:
+            配置段的值，不存在时返回 _MISSING
+        """
+        try:
+            return self._section_cache[name]
+        except KeyError:
+            pass
+        node = self._section_nodes.get(name)
+        value = _MISSING if node is None else construct_yaml_node(node)
+        self._section_cache[name] = value
+        return value
+
+    @property
+    def config(self):
+        """
+        完整配置字典（首次访问时构造全部配置段）
+
         Returns:
             dict: 配置字典
         """
-        with open(self.config_file, "r", encoding="utf-8") as f:
-            return yaml.safe_load(f)
-            
+        if self._config is None:
+            self._config = {name: self._get_section(name) for name in self._section_nodes}
+        return self._config
+
     def get(self, key, default=None):
         """
         获取配置项的值
-        
+
         Args:
             key (str): 配置项键名，支持点号分隔的嵌套键名，如 "logging.level"
             default: 默认值
-            
+
         Returns:
             配置项的值或默认值
         """
-        keys = key.split('.')
-        value = self.config
         try:
-            for k in keys:
-                value = value[k]
-            return value
-        except (KeyError, TypeError):
-            return default
-            
+            value = self._get_cache[key]
+        except KeyError:
+            section, _, rest = key.partition('.')
+            value = self._get_section(section)
+            if value is not _MISSING and rest:
+                try:
+                    for k in rest.split('.'):
+                        value = value[k]
+                except (KeyError, TypeError):
+                    value = _MISSING
+            self._get_cache[key] = value
+        return default if value is _MISSING else value
+
     def get_ollama_config(self):
         """
         获取Ollama配置
@@ -52,18 +169,21 @@ class ConfigManager:
         Returns:
             dict: Ollama配置
         """
-        return self.config.get("ollama", {})
+        return self.get("ollama", {})
 
 
-# 全局配置管理器实例
-config_manager = ConfigManager()
+# 全局配置管理器实例，首次调用 get_config 时创建（导入模块时不读取配置文件）
+config_manager = None
 
 
 def get_config():
     """
     获取全局配置管理器实例
-    
+
     Returns:
         ConfigManager: 全局配置管理器实例
     """
-    return config_manager
\ No newline at end of file
+    global config_manager
+    if config_manager is None:
+        config_manager = ConfigManager()
+    return config_manager
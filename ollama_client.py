@@ -1,9 +1,98 @@
 import httpx
 import time
+import random
 import re
 import logging
-import contextvars
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Optional, Tuple
+
+# 优先使用 orjson 进行 JSON 序列化/反序列化，未安装时回退到标准库
+try:
+    import orjson
+
+    _json_dumps = orjson.dumps
+    _json_loads = orjson.loads
+except ImportError:
+    import json
+
+    def _json_dumps(obj):
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+    _json_loads = json.loads
+
+_JSON_HEADERS = {"content-type": "application/json"}
+
+# 模型输出中需要移除的标记：<think>/</think>、<|im_xxx|> 以及 /reason 之后的内容，合并为一次扫描
+_RE_MODEL_NOISE = re.compile(r'(?i:</?think>)|<\|im_[a-z]+\|>|(?i:/reason\b.*)')
+# 删除所有反引号的转换表
+_BACKTICK_TABLE = str.maketrans('', '', '`')
+
+
+def _retry_delay(attempt: int) -> float:
+    """
+    计算重试等待时间：带随机抖动的指数退避，上限30秒
+
+    Args:
+        attempt: 当前尝试次数（从0开始）
+
+    Returns:
+        等待秒数
+    """
+    return min(30.0, 2 ** attempt + random.uniform(0, 1))
+
+
+def _is_transient_error(exc: Exception) -> bool:
+    """
+    判断异常是否为可重试的临时错误：连接/网络错误或服务端 5xx 响应
+
+    Args:
+        exc: 捕获的异常
+
+    Returns:
+        是否值得重试
+    """
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500
+    return isinstance(exc, httpx.TransportError)
+
+
+class _JsonEndTracker:
+    """
+    增量跟踪流式输出中的顶层 JSON 是否已闭合（忽略字符串中的括号）
+    """
+    __slots__ = ("depth", "in_string", "escape")
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+
+    def feed(self, text: str) -> bool:
+        """
+        处理新到达的一段输出
+
+        Args:
+            text: 本次收到的输出片段
+
+        Returns:
+            顶层 JSON 是否已闭合
+        """
+        for ch in text:
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == '\\':
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch == '{' or ch == '[':
+                self.depth += 1
+            elif ch == '}' or ch == ']':
+                self.depth -= 1
+                if self.depth == 0:
+                    return True
+        return False
 
 
 class OllamaClient:
@@ -12,7 +101,9 @@ class OllamaClient:
     提供统一的接口用于调用 Ollama 模型服务
     """
 
-    def __init__(self, url: str, model_name: str, timeout_seconds: int = 30, max_retries: int = 3, logger=None):
+    def __init__(self, url: str, model_name: str, timeout_seconds: int = 30, max_retries: int = 3, logger=None,
+                 client: Optional[httpx.Client] = None, max_connections: int = 10, system_prompt: str = "",
+                 connect_timeout_seconds: float = 5.0):
         """
         初始化 Ollama 客户端
 
@@ -22,48 +113,139 @@ class OllamaClient:
             timeout_seconds: 请求超时时间
             max_retries: 最大重试次数
             logger: 日志记录器
+            client: 共享的HTTP客户端，为None时自行创建
+            max_connections: 自行创建HTTP客户端时的连接池大小，应与并发处理数一致
+            system_prompt: 默认系统提示词，调用时未指定系统提示词则使用该值
+            connect_timeout_seconds: 建立连接的超时时间，服务未启动时尽快失败而不必等待完整的请求超时
         """
         self.url = url
         self.model_name = model_name
         self.timeout_seconds = timeout_seconds
         self.max_retries = max_retries
         self.logger = logger or logging.getLogger(__name__)
-        # 获取行号上下文变量（如果已在其他地方定义）
-        try:
-            self.row_context_var = contextvars.ContextVar('row_number')
-        except LookupError:
-            # 如果上下文变量未定义，将在使用时动态获取
-            self.row_context_var = None
-            
-        # 添加format属性，默认为空
+        # 预先拼接系统提示词前缀，避免每次调用重复格式化
+        self._system_prefix = (system_prompt + "\n") if system_prompt else ""
+
+        # 按 (temperature, num_predict) 缓存的 options 子字典
+        self._options_cache = {}
+
+        # 模型在服务端的保留时长（如 "30m"），为空时使用服务端默认值；设置时同步更新基础请求体
+        self._keep_alive = ""
+        # JSON 模式下是否流式读取输出并在顶层 JSON 闭合后立即断开；设置时同步更新基础请求体
+        self._stream_early_stop = False
+        # 输出格式，默认为空；设置时同步更新基础请求体
         self.format = ""
 
+        self._max_connections = max_connections
+        # 生成可能耗时较长，连接阶段单独使用较短的超时
+        self._timeout = httpx.Timeout(timeout_seconds, connect=min(connect_timeout_seconds, timeout_seconds))
+
+        # 复用同一个HTTP客户端，保持长连接；重试由 call_model 负责，传输层不再重试
+        self._owns_client = client is None
+        if client is None:
+            client = httpx.Client(
+                timeout=self._timeout,
+                transport=httpx.HTTPTransport(retries=0),
+                limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+            )
+        self._client = client
+
+    @property
+    def format(self) -> str:
+        return self._format
+
+    @format.setter
+    def format(self, value: str):
+        self._format = value or ""
+        self._rebuild_base_payload()
+
+    @property
+    def keep_alive(self) -> str:
+        return self._keep_alive
+
+    @keep_alive.setter
+    def keep_alive(self, value: str):
+        self._keep_alive = value or ""
+        self._rebuild_base_payload()
+
+    @property
+    def stream_early_stop(self) -> bool:
+        return self._stream_early_stop
+
+    @stream_early_stop.setter
+    def stream_early_stop(self, value: bool):
+        self._stream_early_stop = bool(value)
+        self._rebuild_base_payload()
+
+    def _rebuild_base_payload(self):
+        """
+        重新构造每次调用都相同的基础请求体字段
+        """
+        # 只有 JSON 模式的输出才能据括号判断结束（文本模式的思考内容中可能出现括号）
+        stream = self._stream_early_stop and self._format == "json"
+        self._base_payload = {"model": self.model_name, "stream": stream}
+        if self._format:
+            self._base_payload["format"] = self._format
+        if self._keep_alive:
+            self._base_payload["keep_alive"] = self._keep_alive
+        # 预序列化的请求体前缀随基础字段一起失效
+        self._body_head_cache = {}
+
+    def close(self):
+        """
+        关闭底层HTTP客户端，释放连接池（外部传入的客户端由调用方负责关闭）
+        """
+        if self._owns_client:
+            self._client.close()
+
+    def warmup(self) -> bool:
+        """
+        预加载模型：发送不含提示词的请求，Ollama 只加载模型而不生成，模型已加载时立即返回
+
+        Returns:
+            是否成功
+        """
+        payload = {"model": self.model_name, "stream": False}
+        if self._keep_alive:
+            payload["keep_alive"] = self._keep_alive
+        start_time = time.monotonic()
+        try:
+            response = self._client.post(self.url, content=_json_dumps(payload), headers=_JSON_HEADERS)
+            response.raise_for_status()
+        except Exception as e:
+            self.logger.warning("模型预加载失败: %s", e)
+            return False
+        self.logger.info("模型预加载完成，耗时: %.2fs", time.monotonic() - start_time)
+        return True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
     def clean_model_output(self, text: str) -> str:
         """
         清理模型输出，移除不必要的标记
         """
-        text = re.sub(r'</?think>', '', text, flags=re.IGNORECASE)
-        text = re.sub(r'/reason\b.*', '', text, flags=re.IGNORECASE)
-        text = re.sub(r'<\|im_[a-z]+\|>', '', text)
-        text = text.replace('``', '').replace('`', '')
+        text = _RE_MODEL_NOISE.sub('', text)
+        text = text.translate(_BACKTICK_TABLE)
         return text.strip()
 
-    def _extract_row_number(self, task_id: str = None) -> int:
+    def _extract_row_number(self, task_id: str = None, row_number: int = None) -> int:
         """
-        提取行号上下文
+        提取行号
 
         Args:
             task_id: 任务ID
+            row_number: 调用方直接传入的行号
 
         Returns:
             行号,如果无法获取则返回None
         """
-        # 尝试从上下文变量获取
-        if hasattr(self, 'row_context_var') and self.row_context_var:
-            try:
-                return self.row_context_var.get()
-            except LookupError:
-                pass
+        # 调用方已知行号时无需解析task_id
+        if row_number is not None:
+            return row_number
 
         # 从task_id中提取行号(向后兼容)
         if task_id and task_id.startswith('task_'):
@@ -74,113 +256,235 @@ class OllamaClient:
 
         return None
 
-    def call_model(self, prompt: str, system_prompt: str = "", temperature: float = 0.0, num_predict: int = 250, task_id: str = None) -> \
+    def _build_payload(self, prompt: str, system_prompt: str, temperature: float, num_predict: int) -> Dict[str, Any]:
+        """
+        构造请求体
+
+        Args:
+            prompt: 用户输入提示
+            system_prompt: 系统提示词，为空时使用初始化时指定的默认值
+            temperature: 温度参数
+            num_predict: 最大预测token数
+
+        Returns:
+            请求体字典
+        """
+        if system_prompt:
+            full_prompt = system_prompt + "\n" + prompt
+        else:
+            full_prompt = self._system_prefix + prompt
+
+        payload = self._base_payload.copy()
+        payload["prompt"] = full_prompt
+        # 参数组合通常固定，复用同一个 options 子字典（请求体会先序列化再发送，共享是安全的）
+        options_key = (temperature, num_predict)
+        options = self._options_cache.get(options_key)
+        if options is None:
+            options = self._options_cache[options_key] = {
+                "temperature": temperature,
+                "num_predict": num_predict
+            }
+        payload["options"] = options
+        return payload
+
+    def _encode_body(self, prompt: str, system_prompt: str, temperature: float, num_predict: int) -> bytes:
+        """
+        构造并序列化请求体
+
+        使用默认系统提示词时，除 prompt 中的用户输入外其余部分每次都相同，
+        预先序列化为字节前缀，每次只需序列化用户输入并拼接
+
+        Args:
+            prompt: 用户输入提示
+            system_prompt: 系统提示词，为空时使用初始化时指定的默认值
+            temperature: 温度参数
+            num_predict: 最大预测token数
+
+        Returns:
+            JSON 请求体字节串
+        """
+        if system_prompt:
+            return _json_dumps(self._build_payload(prompt, system_prompt, temperature, num_predict))
+
+        options_key = (temperature, num_predict)
+        head = self._body_head_cache.get(options_key)
+        if head is None:
+            # prompt 放在最后一个字段，去掉结尾的 '"}' 即得到以系统提示词结尾、尚未闭合的前缀
+            payload = self._build_payload("", "", temperature, num_predict)
+            payload["prompt"] = payload.pop("prompt")
+            head = self._body_head_cache[options_key] = _json_dumps(payload)[:-2]
+        # JSON 字符串按字符转义，可直接拼接；去掉用户输入序列化结果开头的引号
+        return head + _json_dumps(prompt)[1:] + b"}"
+
+    def _handle_response(self, response: httpx.Response, extra_data: Dict[str, Any]) -> str:
+        """
+        校验响应状态并提取清理后的模型输出
+
+        Args:
+            response: HTTP 响应
+            extra_data: 日志附加字段
+
+        Returns:
+            清理后的模型输出
+        """
+        response.raise_for_status()
+
+        raw_response = _json_loads(response.content)
+        return self._finish_response(raw_response.get("response", "").strip(), extra_data)
+
+    def _read_stream_line(self, line: str, parts: List[str], tracker: _JsonEndTracker) -> bool:
+        """
+        处理流式响应中的一行（每行一个 JSON 对象）
+
+        Args:
+            line: 响应行
+            parts: 已收到的输出片段，本行的输出追加到其中
+            tracker: 顶层 JSON 闭合跟踪器
+
+        Returns:
+            是否可以停止读取：生成已结束或顶层 JSON 已闭合
+        """
+        if not line:
+            return False
+        chunk = _json_loads(line)
+        if "error" in chunk:
+            raise RuntimeError(chunk["error"])
+        text = chunk.get("response")
+        if text:
+            parts.append(text)
+            if tracker.feed(text):
+                return True
+        return bool(chunk.get("done"))
+
+    def _stream_response(self, body: bytes, extra_data: Dict[str, Any]) -> str:
+        """
+        流式发送请求，顶层 JSON 闭合后立即断开连接（服务端随之停止生成，避免 JSON 之后无用的输出）
+
+        Args:
+            body: 请求体
+            extra_data: 日志附加字段
+
+        Returns:
+            清理后的模型输出
+        """
+        parts = []
+        tracker = _JsonEndTracker()
+        with self._client.stream("POST", self.url, content=body, headers=_JSON_HEADERS) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if self._read_stream_line(line, parts, tracker):
+                    break
+        return self._finish_response("".join(parts).strip(), extra_data)
+
+    def _finish_response(self, result_text: str, extra_data: Dict[str, Any]) -> str:
+        """
+        记录并清理模型输出
+
+        Args:
+            result_text: 去除首尾空白的模型输出
+            extra_data: 日志附加字段
+
+        Returns:
+            清理后的模型输出
+        """
+        debug_enabled = self.logger.isEnabledFor(logging.DEBUG)
+        if debug_enabled:
+            self.logger.debug("[原始模型响应]: %r", result_text, extra=extra_data)
+        # JSON 模式下 Ollama 只输出合法 JSON，无需正则清理，由调用方直接解析
+        if self.format == "json":
+            return result_text
+        cleaned_text = self.clean_model_output(result_text)
+        if debug_enabled:
+            self.logger.debug("[清理后响应]: %r", cleaned_text, extra=extra_data)
+        return cleaned_text
+
+    def call_model(self, prompt: str, system_prompt: str = "", temperature: float = 0.0, num_predict: int = 250, task_id: str = None,
+                   row_number: int = None) -> \
     Tuple[bool, str, Dict[str, Any]]:
         """
         调用 Ollama 模型
 
         Args:
             prompt: 用户输入提示
-            system_prompt: 系统提示词
+            system_prompt: 系统提示词，为空时使用初始化时指定的默认值
             temperature: 温度参数
             num_predict: 最大预测token数
             task_id: 任务ID
+            row_number: 行号，传入时不再从task_id中解析
 
         Returns:
             (success: bool, response: str, metadata: dict)
         """
-        full_prompt = f"{system_prompt}\n{prompt}" if system_prompt else prompt
+        body = self._encode_body(prompt, system_prompt, temperature, num_predict)
 
-        payload = {
-            "model": self.model_name,
-            "prompt": full_prompt,
-            "stream": False,
-            "options": {
-                "temperature": temperature,
-                "num_predict": num_predict
-            }
-        }
-        
-        # 如果配置了format参数，则添加到payload中
-        if hasattr(self, 'format') and self.format:
-            payload["format"] = self.format
+        # 获取行号上下文（重试期间不会变化）
+        row_number = self._extract_row_number(task_id, row_number)
+        extra_data = {'row_number': row_number} if row_number else {}
+
+        # 本次调用唯一的元数据字典，各分支直接修改其字段
+        metadata = {"attempt_count": 0, "success": False, "error": None, "elapsed_time_s": 0.0}
 
         # 记录开始时间
-        start_time = time.time()
+        start_time = time.monotonic()
         
         for attempt in range(self.max_retries + 1):
             try:
-                # 获取行号上下文
-                row_number = self._extract_row_number(task_id)
-                extra_data = {'row_number': row_number} if row_number else {}
-
-                self.logger.info(f"调用 Ollama 模型（第 {attempt + 1} 次尝试）", extra=extra_data)
-
-                with httpx.Client(timeout=self.timeout_seconds) as client:
-                    response = client.post(self.url, json=payload)
-                    response.raise_for_status()
+                self.logger.info("调用 Ollama 模型（第 %d 次尝试）", attempt + 1, extra=extra_data)
 
-                    raw_response = response.json()
-                    result_text = raw_response.get("response", "").strip()
-
-                    self.logger.debug(f"[原始模型响应]: {repr(result_text)}", extra=extra_data)
-                    cleaned_text = self.clean_model_output(result_text)
-                    self.logger.debug(f"[清理后响应]: {repr(cleaned_text)}", extra=extra_data)
-                    
-                    # 计算耗时
-                    elapsed_time = (time.time() - start_time)  # 转换为秒
+                if self._base_payload["stream"]:
+                    cleaned_text = self._stream_response(body, extra_data)
+                else:
+                    response = self._client.post(self.url, content=body, headers=_JSON_HEADERS)
+                    cleaned_text = self._handle_response(response, extra_data)
+                
+                # 计算耗时
+                elapsed_time = time.monotonic() - start_time
 
-                    metadata = {
-                        "attempt_count": attempt + 1,
-                        "success": True,
-                        "error": None,
-                        "elapsed_time_s": elapsed_time
-                    }
+                metadata["attempt_count"] = attempt + 1
+                metadata["success"] = True
+                metadata["elapsed_time_s"] = elapsed_time
 
-                    self.logger.info(f"模型调用成功，耗时: {elapsed_time:.2f}s", extra=extra_data)
-                    return True, cleaned_text, metadata
+                self.logger.info("模型调用成功，耗时: %.2fs", elapsed_time, extra=extra_data)
+                return True, cleaned_text, metadata
 
             except httpx.TimeoutException as e:
-                # 获取行号上下文
-                row_number = self._extract_row_number(task_id)
-                extra_data = {'row_number': row_number} if row_number else {}
-
-                self.logger.warning(f"⏱️ Ollama 超时 (尝试 {attempt + 1}/{self.max_retries + 1}): {e}", extra=extra_data, exc_info=True)
+                self.logger.warning("⏱️ Ollama 超时 (尝试 %d/%d): %s", attempt + 1, self.max_retries + 1, e,
+                                    extra=extra_data, exc_info=True)
                 if attempt < self.max_retries:
-                    time.sleep(5 * (attempt + 1))
+                    time.sleep(_retry_delay(attempt))
                 else:
-                    metadata = {
-                        "attempt_count": self.max_retries + 1,
-                        "success": False,
-                        "error": f"Timeout after {self.max_retries + 1} attempts: {str(e)}"
-                    }
-                    self.logger.error(f"Ollama 调用最终超时: {metadata['error']}", extra=extra_data)
+                    metadata["attempt_count"] = self.max_retries + 1
+                    metadata["error"] = f"Timeout after {self.max_retries + 1} attempts: {str(e)}"
+                    metadata["elapsed_time_s"] = time.monotonic() - start_time
+                    self.logger.error("Ollama 调用最终超时: %s", metadata['error'], extra=extra_data)
                     return False, "", metadata
 
             except Exception as e:
-                # 获取行号上下文
-                row_number = self._extract_row_number(task_id)
-                extra_data = {'row_number': row_number} if row_number else {}
-
-                self.logger.error(f"💥 调用异常: {e}", extra=extra_data, exc_info=True)
-                metadata = {
-                    "attempt_count": attempt + 1,
-                    "success": False,
-                    "error": str(e)
-                }
+                # 并发负载下 Ollama 偶尔返回 5xx 或断开连接，退避后重试
+                if attempt < self.max_retries and _is_transient_error(e):
+                    self.logger.warning("Ollama 临时错误 (尝试 %d/%d): %s", attempt + 1, self.max_retries + 1, e,
+                                        extra=extra_data)
+                    time.sleep(_retry_delay(attempt))
+                    continue
+                self.logger.error("💥 调用异常: %s", e, extra=extra_data, exc_info=True)
+                metadata["attempt_count"] = attempt + 1
+                metadata["error"] = str(e)
+                metadata["elapsed_time_s"] = time.monotonic() - start_time
                 return False, "", metadata
 
 
-def create_ollama_client_from_config(config: Dict[str, Any], logger=None) -> OllamaClient:
+def create_ollama_client_from_config(config: Dict[str, Any], logger=None, system_prompt: str = "") -> OllamaClient:
     """
     从配置字典创建 Ollama 客户端实例
 
     Args:
-        config: 包含 ollama 配置的字典
+        config: 包含 ollama 配置的字典，可选包含 processing 配置用于确定连接池大小
         logger: 日志记录器
+        system_prompt: 默认系统提示词
 
     Returns:
-        OllamaClient 实例
+        OllamaClient 实例，内部持有长连接，不再使用时应调用 close()
+        （或通过 with 语句管理）
     """
     ollama_config = config["ollama"]
     client = OllamaClient(
@@ -188,11 +492,17 @@ def create_ollama_client_from_config(config: Dict[str, Any], logger=None) -> Oll
         model_name=ollama_config["model_name"],
         timeout_seconds=ollama_config.get("timeout_seconds", 30),
         max_retries=ollama_config.get("max_retries", 3),
-        logger=logger
+        logger=logger,
+        max_connections=(config.get("processing") or {}).get("max_workers") or 10,
+        system_prompt=system_prompt,
+        connect_timeout_seconds=ollama_config.get("connect_timeout_seconds", 5)
     )
     
-    # 设置format参数
-    if "format" in ollama_config:
-        client.format = ollama_config["format"]
+    # 设置format参数，结构化输出默认使用 JSON 模式
+    client.format = ollama_config.get("format", "json")
+    # 保持模型常驻，避免空闲卸载后重新加载
+    client.keep_alive = ollama_config.get("keep_alive", "")
+    # JSON 模式下流式读取输出，顶层 JSON 闭合后立即停止生成
+    client.stream_early_stop = ollama_config.get("stream_early_stop", False)
 
     return client
\ No newline at end of file
@@ -2,41 +2,150 @@ import os
 import sys
 import json
 import yaml
+import glob
 import shutil
+import time
+import queue
+import atexit
 import logging
 import contextvars
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from datetime import datetime
+from itertools import chain, islice
 from pathlib import Path
-from threading import Thread
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, get_ident
 
 from flask import Flask, request, jsonify, render_template, send_file, redirect, url_for, flash
+from flask.json.provider import DefaultJSONProvider
 from werkzeug.utils import secure_filename
 import pandas as pd
 
+# 优先使用 orjson 处理 JSON 格式日志、任务文件与接口响应，未安装时回退到标准库
+try:
+    import orjson
+
+    def _json_log_dumps(obj):
+        return orjson.dumps(obj, default=str).decode('utf-8')
+
+    def _tasks_dumps(tasks):
+        return orjson.dumps(tasks, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+
+    class OrjsonProvider(DefaultJSONProvider):
+        """使用 orjson 序列化 jsonify 响应"""
+
+        def dumps(self, obj, **kwargs):
+            return orjson.dumps(
+                obj, default=self.default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SORT_KEYS
+            ).decode('utf-8')
+
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+
+    _tasks_loads = orjson.loads
+except ImportError:
+    def _json_log_dumps(obj):
+        return json.dumps(obj, ensure_ascii=False, default=str)
+
+    def _tasks_dumps(tasks):
+        return json.dumps(tasks, ensure_ascii=False, indent=2).encode('utf-8')
+
+    OrjsonProvider = None
+    _tasks_loads = json.loads
+
+# 优先使用 xlsxwriter 写出结果文件（比 openpyxl 快），未安装时使用 pandas 默认引擎
+try:
+    import xlsxwriter  # noqa: F401
+    _EXCEL_WRITER_ENGINE = 'xlsxwriter'
+except ImportError:
+    _EXCEL_WRITER_ENGINE = None
+
+# 优先使用 LibYAML 提供的 C 输出器，未安装时回退到纯 Python 实现
+try:
+    from yaml import CSafeDumper as YamlDumper
+except ImportError:
+    from yaml import SafeDumper as YamlDumper
+
 # 添加当前目录到Python路径
 sys.path.insert(0, os.path.dirname(__file__))
 
 # 导入现有模块
 from white_alarm_processor import WhiteAlarmProcessor
-from config import get_config
+from config import get_config, load_yaml_file
 
 def load_config():
-    """加载配置文件"""
-    with open('config.yaml', 'r', encoding='utf-8') as f:
-        return yaml.safe_load(f)
+    """加载配置文件（文件未修改时复用已解析的节点树，每次返回新的字典）"""
+    return load_yaml_file('config.yaml')
 
 def save_config(config):
-    """保存配置文件"""
+    """保存配置文件（同时刷新允许上传的扩展名）"""
+    global ALLOWED_EXTENSIONS
     with open('config.yaml', 'w', encoding='utf-8') as f:
-        yaml.dump(config, f, allow_unicode=True, default_flow_style=False)
+        yaml.dump(config, f, Dumper=YamlDumper, allow_unicode=True, default_flow_style=False)
+    ALLOWED_EXTENSIONS = allowed_extensions_from(config)
+
+def allowed_extensions_from(config):
+    """从配置中读取允许上传的扩展名集合（统一小写）"""
+    return frozenset(str(ext).lower() for ext in config.get('web', {}).get('allowed_extensions', ['xlsx', 'xls']))
+
+def read_input_excel(filepath, **kwargs):
+    """读取上传的Excel文件（.xls 使用 xlrd）"""
+    if filepath.endswith('.xlsx'):
+        return pd.read_excel(filepath, **kwargs)
+    return pd.read_excel(filepath, engine='xlrd', **kwargs)
+
+def write_results(df, path):
+    """将结果表格写出为Excel文件"""
+    df.to_excel(path, index=False, engine=_EXCEL_WRITER_ENGINE)
+
+class ResultSheetWriter:
+    """
+    逐条写出结果记录
+
+    安装了 xlsxwriter 时以 constant_memory 模式边处理边按行写入，内存占用与结果数量无关；
+    否则按列缓存记录（每列一个列表，不为每条记录保留字典），关闭时通过 write_results 一次写出。
+    没有任何记录时不生成文件。
+    """
+
+    def __init__(self, path, columns):
+        self.path = path
+        self.columns = columns
+        self.count = 0
+        self._workbook = None
+        self._worksheet = None
+        # 只有回退到 pandas 写出时才按列缓存记录
+        self._column_values = None if _EXCEL_WRITER_ENGINE == 'xlsxwriter' else {col: [] for col in columns}
+
+    def write(self, record):
+        """写入一条记录（字典，缺少的列留空）"""
+        if _EXCEL_WRITER_ENGINE == 'xlsxwriter':
+            if self._workbook is None:
+                # 输入内容与路径按原样写为文本，不自动转换为超链接（超长或超出数量限制的链接会被跳过）
+                self._workbook = xlsxwriter.Workbook(self.path, {'constant_memory': True, 'strings_to_urls': False})
+                self._worksheet = self._workbook.add_worksheet()
+                self._worksheet.write_row(0, 0, self.columns)
+            self._worksheet.write_row(self.count + 1, 0, [record.get(col) for col in self.columns])
+        else:
+            for col, values in self._column_values.items():
+                values.append(record.get(col))
+        self.count += 1
+
+    def close(self):
+        """完成写出"""
+        if self._workbook is not None:
+            self._workbook.close()
+            self._workbook = None
+        elif self.count and self._column_values is not None:
+            write_results(pd.DataFrame(self._column_values, columns=self.columns), self.path)
+            self._column_values = None
 
 def load_tasks():
     """加载任务数据"""
     try:
-        with open('tasks.json', 'r', encoding='utf-8') as f:
+        with open('tasks.json', 'rb') as f:
             content = f.read().strip()
             if content:
-                return json.loads(content)
+                return _tasks_loads(content)
             else:
                 return {}
     except FileNotFoundError:
@@ -46,9 +155,33 @@ def load_tasks():
         return {}
 
 def save_tasks(tasks):
-    """保存任务数据"""
-    with open('tasks.json', 'w', encoding='utf-8') as f:
-        json.dump(tasks, f, ensure_ascii=False, indent=2)
+    """保存任务数据（先写临时文件再原子替换，读取方不会看到写了一半的文件）"""
+    tmp_path = f"tasks.json.{os.getpid()}.{get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_tasks_dumps(tasks))
+    os.replace(tmp_path, 'tasks.json')
+
+def find_task_logs(log_dir, prefix):
+    """查找日志目录中以指定前缀开头的任务日志文件"""
+    return glob.glob(os.path.join(glob.escape(log_dir), f"{glob.escape(prefix)}*.log"))
+
+# 串行化 tasks.json 的“读取-修改-保存”（请求处理线程与后台任务线程共用），避免并发写入互相覆盖对方的更新
+_tasks_lock = Lock()
+
+def mutate_tasks(fn):
+    """在锁内加载任务数据，调用 fn(tasks) 原地修改后保存，返回 fn 的返回值"""
+    with _tasks_lock:
+        tasks = load_tasks()
+        result = fn(tasks)
+        save_tasks(tasks)
+        return result
+
+def update_task(task_id, task):
+    """将任务记录合并到 tasks.json 中已有的同一任务（任务已被删除时不写入）"""
+    def merge(tasks):
+        if task_id in tasks:
+            tasks[task_id].update(task)
+    mutate_tasks(merge)
 
 def cleanup_tasks_on_startup():
     """在应用启动时清理任务，只保留已完成的任务"""
@@ -73,12 +206,8 @@ def cleanup_tasks_on_startup():
                     log_dir = config.get('logging', {}).get('log_dir', 'logs')
                     
                     # 查找并删除匹配的任务日志文件
-                    if os.path.exists(log_dir):
-                        for filename in os.listdir(log_dir):
-                            if filename.startswith(f"{task_id}_") and filename.endswith(".log"):
-                                log_filepath = os.path.join(log_dir, filename)
-                                if os.path.exists(log_filepath):
-                                    os.remove(log_filepath)
+                    for log_filepath in find_task_logs(log_dir, f"{task_id}_"):
+                        os.remove(log_filepath)
                 except Exception as e:
                     print(f"清理任务 {task_id} 的文件时出错: {e}")
                 
@@ -96,6 +225,8 @@ def cleanup_tasks_on_startup():
 
 app = Flask(__name__)
 app.secret_key = 'your_secret_key_here'
+if OrjsonProvider is not None:
+    app.json = OrjsonProvider(app)
 
 # 添加自定义过滤器用于计算持续时间
 @app.template_filter('duration_format')
@@ -129,19 +260,38 @@ def duration_format(completed_at, started_at):
     except Exception:
         return "未知"
 
-# 确保必要的目录存在
-def initialize_app():
-    config = load_config()
-    UPLOAD_FOLDER = config.get('web', {}).get('upload_folder', 'uploads')
-    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-    return config
-
-app_config = initialize_app()
+app_config = load_config()
 UPLOAD_FOLDER = app_config.get('web', {}).get('upload_folder', 'uploads')
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+# 允许上传的扩展名在加载配置时计算一次，通过配置页面保存时由 save_config 刷新
+ALLOWED_EXTENSIONS = allowed_extensions_from(app_config)
+
+# 后台任务线程池：同时运行的任务数有上限，其余任务排队等待（每个任务内部另有按行并发的线程池）
+task_executor = ThreadPoolExecutor(
+    max_workers=app_config.get('web', {}).get('max_concurrent_tasks') or 2,
+    thread_name_prefix='task'
+)
+
+# 创建目录、清理任务等有副作用的初始化推迟到启动服务或处理第一个请求时执行，
+# 导入本模块（如测试、性能分析）不会修改文件系统
+_runtime_lock = Lock()
+_runtime_initialized = False
 
-# 在应用启动时清理任务
-tasks = cleanup_tasks_on_startup()
+def initialize_runtime():
+    """确保必要的目录存在并清理未完成的任务（只执行一次）"""
+    global _runtime_initialized
+    with _runtime_lock:
+        if _runtime_initialized:
+            return
+        os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+        cleanup_tasks_on_startup()
+        _runtime_initialized = True
+
+@app.before_request
+def ensure_runtime_initialized():
+    """处理请求前完成运行时初始化"""
+    if not _runtime_initialized:
+        initialize_runtime()
 
 # 任务存储（在实际应用中应使用数据库）
 
@@ -149,27 +299,29 @@ tasks = cleanup_tasks_on_startup()
 task_progress = {}
 
 def update_task_progress(task_id, processed_rows, total_rows, status):
-    """更新任务进度"""
+    """更新任务进度（只记录时间戳，读取进度时再格式化）"""
     task_progress[task_id] = {
         'processed_rows': processed_rows,
         'total_rows': total_rows,
         'status': status,
-        'updated_at': datetime.now().isoformat()
+        'updated_at': time.time()
     }
 
 def get_task_progress(task_id):
     """获取任务进度"""
-    return task_progress.get(task_id, {
-        'processed_rows': 0,
-        'total_rows': 0,
-        'status': 'unknown',
-        'updated_at': datetime.now().isoformat()
-    })
+    progress = task_progress.get(task_id)
+    if progress is None:
+        return {
+            'processed_rows': 0,
+            'total_rows': 0,
+            'status': 'unknown',
+            'updated_at': datetime.now().isoformat()
+        }
+    return {**progress, 'updated_at': datetime.fromtimestamp(progress['updated_at']).isoformat()}
 
 def allowed_file(filename):
-    config = load_config()
-    allowed_extensions = config.get('web', {}).get('allowed_extensions', ['xlsx', 'xls'])
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in allowed_extensions
+    _, dot, ext = filename.rpartition('.')
+    return bool(dot) and ext.lower() in ALLOWED_EXTENSIONS
 
 
 @app.route('/')
@@ -246,12 +398,9 @@ def upload_file():
             filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
             file.save(filepath)
             
-            # 读取文件以获取列信息
+            # 读取文件以获取列信息（只解析表头，不读取数据行）
             try:
-                if filename.endswith('.xlsx'):
-                    df = pd.read_excel(filepath)
-                else:
-                    df = pd.read_excel(filepath, engine='xlrd')
+                df = read_input_excel(filepath, nrows=0)
                 columns = df.columns.tolist()
             except Exception as e:
                 flash(f'无法读取文件列信息: {str(e)}', 'error')
@@ -259,9 +408,7 @@ def upload_file():
             
             # 保存任务信息
             task_id = f"task_{int(datetime.now().timestamp())}"
-            # 先加载现有的任务
-            tasks = load_tasks()
-            tasks[task_id] = {
+            new_task = {
                 'id': task_id,
                 'filename': filename,
                 'filepath': filepath,
@@ -273,8 +420,8 @@ def upload_file():
                 'ignored_columns': []   # 用户忽略的列
             }
             
-            # 保存任务到文件
-            save_tasks(tasks)
+            # 在锁内合并到已有任务并保存到文件
+            mutate_tasks(lambda tasks: tasks.__setitem__(task_id, new_task))
             
             flash(f'文件上传成功，任务ID: {task_id}', 'success')
             return redirect(url_for('column_selection', task_id=task_id))
@@ -308,12 +455,11 @@ def column_selection(task_id):
         ignored_columns_input = request.form.get('ignored_columns_input', '')
         ignored_columns = [col.strip() for col in ignored_columns_input.split(',') if col.strip()]
         
-        # 更新任务信息
-        task['selected_columns'] = selected_columns
-        task['ignored_columns'] = ignored_columns
-        
-        # 保存任务
-        save_tasks(tasks)
+        # 更新并保存任务信息
+        update_task(task_id, {
+            'selected_columns': selected_columns,
+            'ignored_columns': ignored_columns
+        })
         
         flash('列选择已保存', 'success')
         return redirect(url_for('task_detail', task_id=task_id))
@@ -333,14 +479,8 @@ def preview_file(task_id):
     filepath = task['filepath']
     
     try:
-        # 读取前10行数据
-        if filepath.endswith('.xlsx'):
-            df = pd.read_excel(filepath)
-        else:
-            df = pd.read_excel(filepath, engine='xlrd')
-        
-        # 只取前10行
-        preview_df = df.head(10)
+        # 只读取前10行数据，不解析整个工作簿
+        preview_df = read_input_excel(filepath, nrows=10)
         
         # 如果用户选择了特定的列，则只显示这些列
         selected_columns = task.get('selected_columns', [])
@@ -350,8 +490,10 @@ def preview_file(task_id):
             if existing_columns:
                 preview_df = preview_df[existing_columns]
         
-        columns = preview_df.columns.tolist()
-        rows = preview_df.values.tolist()
+        # 一次转换得到列名和行数据
+        split = preview_df.to_dict(orient='split')
+        columns = split['columns']
+        rows = split['data']
         
         return render_template('preview.html', task=task, columns=columns, rows=rows)
     except Exception as e:
@@ -369,6 +511,67 @@ def task_detail(task_id):
     task = tasks[task_id]
     return render_template('task_detail.html', task=task)
 
+class RowContextFilter(logging.Filter):
+    """从上下文变量读取当前行号并写入日志记录"""
+
+    def __init__(self, row_context_var):
+        super().__init__()
+        self.row_context_var = row_context_var
+
+    def filter(self, record):
+        record.row_number = self.row_context_var.get()
+        return True
+
+class ConsoleFilter(logging.Filter):
+    """控制台过滤器,只允许Web服务器日志通过,阻止任务处理日志"""
+
+    def filter(self, record):
+        # 阻止所有带有row_number属性的日志输出到控制台
+        return not hasattr(record, 'row_number')
+
+class JsonFormatter(logging.Formatter):
+    """JSON格式日志"""
+
+    def format(self, record):
+        log_entry = {
+            "timestamp": self.formatTime(record),
+            "level": record.levelname,
+            "message": record.getMessage()
+        }
+        if hasattr(record, 'row_number') and record.row_number is not None:
+            log_entry["row_number"] = record.row_number
+        return _json_log_dumps(log_entry)
+
+class TextFormatter(logging.Formatter):
+    """文本格式日志,带行号前缀"""
+
+    def format(self, record):
+        log_message = super().format(record)
+        if hasattr(record, 'row_number') and record.row_number is not None:
+            log_message = f"[task_{record.row_number}] {log_message}"
+        return log_message
+
+class TaskQueueHandler(QueueHandler):
+    """队列处理器,在调用线程中只负责入队,文件与控制台写入由后台监听线程完成"""
+
+    def __init__(self, *handlers):
+        log_queue = queue.SimpleQueue()
+        super().__init__(log_queue)
+        self.listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        self.listener.start()
+        # 进程退出时任务仍未结束，也要写完队列中的日志
+        atexit.register(self.close)
+
+    def close(self):
+        # 停止监听线程(会先写完队列中剩余的日志),再关闭实际的处理器
+        if self.listener is not None:
+            atexit.unregister(self.close)
+            self.listener.stop()
+            for handler in self.listener.handlers:
+                handler.close()
+            self.listener = None
+        super().close()
+
 def setup_task_logger(task_id, config):
     """
     为任务设置专用日志记录器
@@ -378,7 +581,7 @@ def setup_task_logger(task_id, config):
         config: 配置字典
 
     Returns:
-        tuple: (task_logger, row_context_var) - 日志记录器和上下文变量
+        tuple: (task_logger, row_context_var, log_filepath) - 日志记录器、上下文变量和日志文件路径
     """
     # 设置日志文件
     log_dir = config.get('logging', {}).get('log_dir', 'logs')
@@ -387,55 +590,19 @@ def setup_task_logger(task_id, config):
     # 使用配置文件中的日志文件模板
     log_file_template = config["logging"].get("log_file", "{log_dir}/{task_id}_{timestamp}.log")
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    log_filename = log_file_template.replace("{log_dir}", log_dir).replace("{timestamp}", timestamp).replace("{task_id}", task_id)
+    log_filename = log_file_template.format_map({"log_dir": log_dir, "timestamp": timestamp, "task_id": task_id})
     log_filepath = os.path.join(log_dir, os.path.basename(log_filename))
 
     # 创建上下文变量来存储当前行号
     row_context_var = contextvars.ContextVar('row_number', default=None)
 
-    # 自定义日志过滤器,用于添加行号前缀
-    class RowContextFilter(logging.Filter):
-        def filter(self, record):
-            row_number = row_context_var.get()
-            if row_number is not None:
-                record.row_number = row_number
-            else:
-                record.row_number = None
-            return True
-
-    # 控制台过滤器,只允许Web服务器日志通过,阻止任务处理日志
-    class ConsoleFilter(logging.Filter):
-        def filter(self, record):
-            # 阻止所有带有row_number属性的日志输出到控制台
-            return not hasattr(record, 'row_number')
-
     # 配置日志格式
     LOG_LEVEL = getattr(logging, config["logging"]["level"].upper())
     LOG_FORMAT = config["logging"].get("format", "text")
 
     if LOG_FORMAT == "json":
-        # JSON格式日志
-        class JsonFormatter(logging.Formatter):
-            def format(self, record):
-                log_entry = {
-                    "timestamp": self.formatTime(record),
-                    "level": record.levelname,
-                    "message": record.getMessage()
-                }
-                if hasattr(record, 'row_number') and record.row_number is not None:
-                    log_entry["row_number"] = record.row_number
-                return json.dumps(log_entry, ensure_ascii=False)
-
         formatter = JsonFormatter()
     else:
-        # 文本格式日志
-        class TextFormatter(logging.Formatter):
-            def format(self, record):
-                log_message = super().format(record)
-                if hasattr(record, 'row_number') and record.row_number is not None:
-                    log_message = f"[task_{record.row_number}] {log_message}"
-                return log_message
-
         formatter = TextFormatter("%(asctime)s [%(levelname)s] %(message)s")
 
     # 为当前任务创建专用的日志记录器
@@ -448,7 +615,6 @@ def setup_task_logger(task_id, config):
         task_logger.removeHandler(handler)
 
     # 添加新的处理器
-    from logging.handlers import RotatingFileHandler
     file_handler = RotatingFileHandler(
         log_filepath,
         maxBytes=10*1024*1024,  # 10MB
@@ -456,19 +622,26 @@ def setup_task_logger(task_id, config):
         encoding='utf-8'
     )
     file_handler.setFormatter(formatter)
-    file_handler.addFilter(RowContextFilter())
 
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(formatter)
     console_handler.addFilter(ConsoleFilter())
 
-    task_logger.addHandler(file_handler)
-    task_logger.addHandler(console_handler)
+    queue_handler = TaskQueueHandler(file_handler, console_handler)
+    # 行号上下文只在调用线程中可见,必须在入队前写入日志记录
+    queue_handler.addFilter(RowContextFilter(row_context_var))
+    task_logger.addHandler(queue_handler)
 
     # 立即写入一条日志,确保文件不为空
     task_logger.info(f"[task_{task_id.split('_')[1]}] 开始处理任务 {task_id}")
 
-    return task_logger, row_context_var
+    return task_logger, row_context_var, log_filepath
+
+def close_task_logger(task_logger):
+    """关闭并移除任务日志记录器的处理器（同时停止后台日志监听线程）"""
+    for handler in task_logger.handlers[:]:
+        handler.close()
+        task_logger.removeHandler(handler)
 
 def process_task_async(task_id, max_rows_override=None):
     """异步处理任务"""
@@ -477,6 +650,9 @@ def process_task_async(task_id, max_rows_override=None):
         return
     
     task = tasks[task_id]
+    task_logger = None
+    processor = None
+    valid_results = invalid_records = None
     try:
         # 加载配置
         config = load_config()
@@ -487,6 +663,10 @@ def process_task_async(task_id, max_rows_override=None):
         output_dir = os.path.join(output_base_dir, task_id)
         os.makedirs(output_dir, exist_ok=True)
         task['output_dir'] = output_dir
+
+        # 设置任务日志记录器，日志文件路径随任务状态一起保存，查看日志时无需扫描日志目录
+        task_logger, row_context_var, log_filepath = setup_task_logger(task_id, config)
+        task['log_filepath'] = log_filepath
         
         # 更新任务状态
         task['status'] = 'processing'
@@ -494,14 +674,19 @@ def process_task_async(task_id, max_rows_override=None):
         update_task_progress(task_id, 0, 0, 'processing')
         
         # 保存任务状态
-        save_tasks(tasks)
+        update_task(task_id, task)
+        
+        # 创建WhiteAlarmProcessor实例，读取数据的同时在后台预加载模型
+        config_manager = get_config()
+        processor = WhiteAlarmProcessor(config_manager, task_logger)
+        processor.start_warmup()
         
         # 复制输入文件到输出目录
         input_filepath = os.path.join(output_dir, task['filename'])
         shutil.copy2(task['filepath'], input_filepath)
         
         # 处理文件
-        df = pd.read_excel(task['filepath'])
+        df = read_input_excel(task['filepath'])
         total_rows = len(df)
         task['total_rows'] = total_rows
         update_task_progress(task_id, 0, total_rows, 'processing')
@@ -520,114 +705,150 @@ def process_task_async(task_id, max_rows_override=None):
             else:
                 task['processed_rows'] = total_rows
 
-        # 设置任务日志记录器
-        task_logger, row_context_var = setup_task_logger(task_id, config)
+        # 处理过程：结果按行号顺序产生，逐条写出
+        valid_results = ResultSheetWriter(
+            os.path.join(output_dir, "valid_results.xlsx"),
+            ["序号", "输入内容", "原始路径", "文件名", "类型", "应用名称"]
+        )
+        invalid_records = ResultSheetWriter(
+            os.path.join(output_dir, "invalid_records.xlsx"),
+            ["序号", "原始路径", "文件名", "类型", "应用名称", "输入内容"]
+        )
 
-        # 创建任务日志适配器工厂
-        def task_logger_factory(row_number):
-            # 设置上下文变量
-            row_context_var.set(row_number)
-            from logging import LoggerAdapter
-            return LoggerAdapter(task_logger, {'row_number': row_number})
-        
-        # 创建WhiteAlarmProcessor实例
-        config_manager = get_config()
-        processor = WhiteAlarmProcessor(config_manager, task_logger)
-        
-        # 处理过程
-        valid_results = []
-        invalid_records = []
+        # 列选择在整个任务中不变，忽略列转换为 frozenset 以便逐行 O(1) 查询
+        selected_columns = task.get('selected_columns')
+        ignored_columns = frozenset(task.get('ignored_columns') or ())
+
+        # 按列一次性拼接所有行的模型输入文本，循环中不再为每行构造 Series
+        input_texts = processor.prepare_inputs(df, selected_columns or [], ignored_columns)
+
+        # 进度每处理约 0.5% 的行更新一次，任务结束时再更新为完成
+        progress_step = max(1, total_rows // 200)
         
-        for idx, row in df.iterrows():
+        # 调试日志的格式化开销只在启用 DEBUG 级别时产生
+        debug_enabled = task_logger.isEnabledFor(logging.DEBUG)
+
+        # 未选择任何列时将整行交给 process_row：按元组逐行读取并组装为字典，不为每行构造 Series
+        if selected_columns:
+            row_items = ((idx, input_text, None) for idx, input_text in input_texts.items())
+        else:
+            row_columns = df.columns.tolist()
+            row_items = zip(input_texts.index, input_texts, df.itertuples(index=False, name=None))
+
+        def process_one(item):
+            """在线程池中处理单行数据，异常随结果一起返回"""
+            idx, input_text, values = item
+            # 设置当前行号，由 RowContextFilter 写入该行的日志记录
+            row_context_var.set(idx + 1)
             try:
-                # 获取当前行的日志记录器
-                row_logger = task_logger_factory(idx + 1)
-                
                 # 记录开始处理某一行
-                row_logger.debug(f"开始处理第{idx + 1}行数据")
+                if debug_enabled:
+                    task_logger.debug(f"开始处理第{idx + 1}行数据")
                 
-                # 传递用户选择的列信息
-                result = processor.process_row(
-                    row, 
-                    idx, 
-                    selected_columns=task.get('selected_columns'), 
-                    ignored_columns=task.get('ignored_columns'),
-                    task_logger=row_logger
+                if selected_columns:
+                    result = processor.process_prepared(input_text, idx + 1, task_logger)
+                else:
+                    # 未选择任何列时由 process_row 返回提示信息
+                    result = processor.process_row(
+                        dict(zip(row_columns, values)), 
+                        idx, 
+                        selected_columns=selected_columns, 
+                        ignored_columns=ignored_columns,
+                        task_logger=task_logger
+                    )
+                return idx, result, None
+            except Exception as e:
+                task_logger.error(f"处理行 {idx} 时出错: {e}", exc_info=True)
+                return idx, None, e
+
+        def process_group(items):
+            """在线程池中将多行合并为一次模型请求处理，返回各行的 (行索引, 结果, 异常)"""
+            row_context_var.set(items[0][0] + 1)
+            try:
+                results = processor.process_prepared_group(
+                    [(input_text, idx + 1) for idx, input_text, _ in items], task_logger
                 )
-                if result["type"] == "no_path_found":
-                    row_logger.debug(f"行数据未提取到任何路径")
-                    invalid_records.append({
+                return [(item[0], result, None) for item, result in zip(items, results)]
+            except Exception as e:
+                # 整组处理出错时逐行重新处理，错误只记录在出错的行上
+                task_logger.error(f"处理行 {items[0][0]}-{items[-1][0]} 时出错，改为逐行处理: {e}", exc_info=True)
+                return [process_one(item) for item in items]
+
+        # 模型调用是 I/O 密集型操作，多行并发处理；executor.map 按行号顺序返回结果，
+        # 写出结果仍在当前线程中按顺序进行
+        max_workers = config.get('processing', {}).get('max_workers') or 10
+        # 每次请求合并的行数，大于1时多行合并为一次模型请求
+        rows_per_request = config.get('processing', {}).get('rows_per_request') or 1
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            if selected_columns and rows_per_request > 1:
+                row_groups = iter(lambda: list(islice(row_items, rows_per_request)), [])
+                row_results = chain.from_iterable(executor.map(process_group, row_groups))
+            else:
+                row_results = executor.map(process_one, row_items)
+            for idx, result, error in row_results:
+                row_context_var.set(idx + 1)
+                if error is None:
+                    try:
+                        if result["type"] == "no_path_found":
+                            if debug_enabled:
+                                task_logger.debug("行数据未提取到任何路径")
+                            invalid_records.write({
+                                "序号": idx + 1,
+                                "原始路径": "<原始行未提取到任何路径>",
+                                "文件名": "<无文件名>",
+                                "类型": "未知",
+                                "应用名称": "<无>",
+                                "输入内容": str(result["row"])
+                            })
+                        elif result["type"] == "processed":
+                            for i, output in enumerate(result["outputs"], 1):  # 从1开始编号
+                                raw_path = output["原始路径"]
+                                is_valid = processor.is_valid_path(raw_path, allow_filename_only=True)
+                                if debug_enabled:
+                                    task_logger.debug(f"[ollama{i}] 路径验证结果: {repr(raw_path)} -> {'有效' if is_valid else '无效'}")
+                                if is_valid:
+                                    valid_results.write(output)
+                                else:
+                                    invalid_records.write(output)
+                                    if debug_enabled:
+                                        task_logger.debug(f"[ollama{i}] 添加无效记录: {repr(raw_path)}")
+                        
+                        # 记录完成处理某一行
+                        if debug_enabled:
+                            task_logger.debug(f"第{idx + 1}行数据处理完成")
+                    except Exception as e:
+                        task_logger.error(f"处理行 {idx} 时出错: {e}", exc_info=True)
+                        error = e
+                if error is not None:
+                    invalid_records.write({
                         "序号": idx + 1,
-                        "原始路径": "<原始行未提取到任何路径>",
+                        "原始路径": f"<处理出错: {str(error)}>",
                         "文件名": "<无文件名>",
-                        "类型": "未知",
+                        "类型": "错误",
                         "应用名称": "<无>",
-                        "输入内容": str(result["row"])
+                        "输入内容": str(df.loc[idx].to_dict())
                     })
-                elif result["type"] == "processed":
-                    for i, output in enumerate(result["outputs"], 1):  # 从1开始编号
-                        raw_path = output["原始路径"]
-                        is_valid = processor.is_valid_path(raw_path, allow_filename_only=True)
-                        row_logger.debug(f"[ollama{i}] 路径验证结果: {repr(raw_path)} -> {'有效' if is_valid else '无效'}")
-                        if is_valid:
-                            valid_results.append(output)
-                        else:
-                            invalid_records.append(output)
-                            row_logger.debug(f"[ollama{i}] 添加无效记录: {repr(raw_path)}")
-                
-                # 记录完成处理某一行
-                row_logger.debug(f"第{idx + 1}行数据处理完成")
                 
                 # 更新进度
-                update_task_progress(task_id, idx + 1, total_rows, 'processing')
-            except Exception as e:
-                # 获取当前行的日志记录器
-                row_logger = task_logger_factory(idx + 1)
-                row_logger.error(f"处理行 {idx} 时出错: {e}", exc_info=True)
-                invalid_records.append({
-                    "序号": idx + 1,
-                    "原始路径": f"<处理出错: {str(e)}>",
-                    "文件名": "<无文件名>",
-                    "类型": "错误",
-                    "应用名称": "<无>",
-                    "输入内容": str(row.to_dict())
-                })
+                if (idx + 1) % progress_step == 0:
+                    update_task_progress(task_id, idx + 1, total_rows, 'processing')
         
         # 保存结果
-        if invalid_records:
-            invalid_df = pd.DataFrame(invalid_records)
-            cols = ["序号", "原始路径", "文件名", "类型", "应用名称", "输入内容"]
-            for col in cols:
-                if col not in invalid_df.columns:
-                    invalid_df[col] = ""
-            invalid_df = invalid_df[cols]
-            invalid_df.to_excel(os.path.join(output_dir, "invalid_records.xlsx"), index=False)
-        
-        if valid_results:
-            result_df = pd.DataFrame(valid_results)
-            result_df.sort_values("序号", inplace=True, ignore_index=True)
-            result_df.to_excel(os.path.join(output_dir, "valid_results.xlsx"), index=False)
+        invalid_records.close()
+        valid_results.close()
         
         # 更新任务状态
         task['status'] = 'completed'
         task['completed_at'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        task['valid_count'] = len(valid_results)
-        task['invalid_count'] = len(invalid_records)
+        task['valid_count'] = valid_results.count
+        task['invalid_count'] = invalid_records.count
         update_task_progress(task_id, total_rows, total_rows, 'completed')
         
         # 记录任务完成日志
-        task_logger.info(f"[task_{task_id.split('_')[1]}] 任务 {task_id} 处理完成，有效结果: {len(valid_results)}, 无效记录: {len(invalid_records)}")
+        task_logger.info(f"[task_{task_id.split('_')[1]}] 任务 {task_id} 处理完成，有效结果: {valid_results.count}, 无效记录: {invalid_records.count}")
         
-        # 保存任务状态
-        tasks = load_tasks()  # 重新加载任务以防在处理过程中有更新
-        if task_id in tasks:
-            tasks[task_id].update(task)
-            save_tasks(tasks)
-        
-        # 关闭日志处理器
-        for handler in task_logger.handlers[:]:
-            handler.close()
-            task_logger.removeHandler(handler)
+        # 保存任务状态（合并到重新加载的任务列表，以防在处理过程中有更新）
+        update_task(task_id, task)
             
     except Exception as e:
         task['status'] = 'failed'
@@ -635,11 +856,22 @@ def process_task_async(task_id, max_rows_override=None):
         update_task_progress(task_id, 0, 0, 'failed')
         logging.error(f"处理任务 {task_id} 时出错: {e}", exc_info=True)
         
-        # 保存任务状态
-        tasks = load_tasks()  # 重新加载任务以防在处理过程中有更新
-        if task_id in tasks:
-            tasks[task_id].update(task)
-            save_tasks(tasks)
+        # 保存任务状态（合并到重新加载的任务列表，以防在处理过程中有更新）
+        update_task(task_id, task)
+    finally:
+        # 任务中途出错时也要完成已写出的结果文件并释放文件句柄（已关闭的写出器再次关闭不做任何事）
+        for writer in (invalid_records, valid_results):
+            if writer is not None:
+                try:
+                    writer.close()
+                except Exception as e:
+                    logging.error(f"关闭结果文件 {writer.path} 时出错: {e}", exc_info=True)
+        # 无论任务成功与否都释放模型客户端连接（等待后台预加载结束）并关闭日志处理器，
+        # 避免连接、后台线程与文件句柄泄漏
+        if processor is not None:
+            processor.close()
+        if task_logger is not None:
+            close_task_logger(task_logger)
 
 @app.route('/process/<task_id>', methods=['POST'])
 def process_task(task_id):
@@ -652,9 +884,8 @@ def process_task(task_id):
     # 获取表单参数
     max_rows_override = request.form.get('max_rows_override')
     
-    # 启动异步任务处理
-    thread = Thread(target=process_task_async, args=(task_id, max_rows_override))
-    thread.start()
+    # 提交到后台任务线程池处理
+    task_executor.submit(process_task_async, task_id, max_rows_override)
     
     # 立即返回成功响应
     return jsonify({'status': 'success', 'message': '任务已提交，正在后台处理中'})
@@ -685,18 +916,12 @@ def delete_task(task_id):
         log_dir = config.get('logging', {}).get('log_dir', 'logs')
         
         # 查找并删除匹配的任务日志文件（支持新旧两种命名规范）
-        if os.path.exists(log_dir):
-            for filename in os.listdir(log_dir):
-                if (filename.startswith(f"{task_id}_") or filename.startswith(f"task_{task_id}_")) and filename.endswith(".log"):
-                    log_filepath = os.path.join(log_dir, filename)
-                    if os.path.exists(log_filepath):
-                        os.remove(log_filepath)
+        for prefix in (f"{task_id}_", f"task_{task_id}_"):
+            for log_filepath in find_task_logs(log_dir, prefix):
+                os.remove(log_filepath)
         
-        # 从任务字典中删除任务
-        del tasks[task_id]
-        
-        # 保存更新后的任务列表
-        save_tasks(tasks)
+        # 从任务列表中删除任务并保存
+        mutate_tasks(lambda tasks: tasks.pop(task_id, None))
         
         flash(f'任务 {task_id} 已成功删除', 'success')
     except Exception as e:
@@ -780,6 +1005,9 @@ def api_task_progress(task_id):
         }
     })
 
+# 查看日志时最多返回的字节数（日志文件末尾部分）
+LOG_VIEW_TAIL_BYTES = 1024 * 1024
+
 @app.route('/api/logs/<task_id>')
 def get_task_log(task_id):
     """获取任务日志"""
@@ -793,35 +1021,35 @@ def get_task_log(task_id):
     if '..' in task_id or '/' in task_id or '\\' in task_id:
         return jsonify({'status': 'error', 'message': '无效的任务ID'}), 400
     
-    # 从配置中获取日志目录
-    config = load_config()
-    log_dir = config.get('logging', {}).get('log_dir', 'logs')
-    
-    # 查找匹配的任务日志文件
-    log_filename = None
-    if os.path.exists(log_dir):
-        for filename in os.listdir(log_dir):
-            if filename.startswith(f"{task_id}_") and filename.endswith(".log"):
-                log_filename = filename
-                break
-
-    # 如果未找到日志文件,返回错误
-    if not log_filename:
-        return jsonify({'status': 'error', 'message': '日志文件不存在'}), 404
-
-    log_filepath = os.path.join(log_dir, log_filename)
+    # 优先使用任务记录中保存的日志文件路径，旧任务按文件名在日志目录中查找
+    log_filepath = task.get('log_filepath')
+    if not log_filepath:
+        config = load_config()
+        log_dir = config.get('logging', {}).get('log_dir', 'logs')
+        log_files = find_task_logs(log_dir, f"{task_id}_")
+        # 如果未找到日志文件,返回错误
+        if not log_files:
+            return jsonify({'status': 'error', 'message': '日志文件不存在'}), 404
+        log_filepath = log_files[0]
     
     # 检查文件是否存在
     if not os.path.exists(log_filepath):
         return jsonify({'status': 'error', 'message': '日志文件不存在'}), 404
     
     try:
-        # 读取日志文件内容（以只读模式打开，支持正在被写入的文件）
-        with open(log_filepath, 'r', encoding='utf-8') as f:
-            log_content = f.read()
+        # 只读取日志文件末尾部分（以只读模式打开，支持正在被写入的文件），大日志不整体载入内存
+        with open(log_filepath, 'rb') as f:
+            size = f.seek(0, os.SEEK_END)
+            truncated = size > LOG_VIEW_TAIL_BYTES
+            f.seek(size - LOG_VIEW_TAIL_BYTES if truncated else 0)
+            log_content = f.read().decode('utf-8', errors='replace')
+        if truncated:
+            # 丢弃被截断的第一行
+            log_content = f"...（仅显示最后 {LOG_VIEW_TAIL_BYTES // 1024} KB）\n" + log_content.partition('\n')[2]
         return jsonify({'status': 'success', 'data': log_content})
     except Exception as e:
         return jsonify({'status': 'error', 'message': f'读取日志文件失败: {str(e)}'}), 500
 
 if __name__ == '__main__':
+    initialize_runtime()
     app.run(host='127.0.0.1', port=5000)
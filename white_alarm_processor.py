@@ -3,10 +3,302 @@ import re
 import logging
 import os
 import json
-from pathlib import Path
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 
 from ollama_client import OllamaClient, create_ollama_client_from_config
 
+# 优先使用 orjson 解析模型响应（其异常类型继承自 json.JSONDecodeError），未安装时回退到标准库
+try:
+    import orjson
+
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+# JSON 截取：首个开始符；贪婪匹配到最后一个结束符（一次正向扫描加一次回溯）
+_JSON_OPEN_RE = re.compile(r'[{\[]')
+_JSON_LAST_CLOSE_RE = re.compile(r'.*[}\]]', re.DOTALL)
+_JSON_PAIRS = {'{': '}', '[': ']'}
+# JSON 配对扫描：结构字符与字符串开头；字符串剩余部分（含转义）直到结束引号
+_JSON_STRUCT_RE = re.compile(r'[{}\[\]"]')
+_JSON_STRING_TAIL_RE = re.compile(r'(?:[^"\\]|\\.)*"', re.DOTALL)
+
+# 过滤条件解析用的正则："and" 分隔符
+_AND_SPLIT_RE = re.compile(r'\s+and\s+')
+
+# 写入Excel前的清理（一次 translate 完成）：换行、制表符替换为空格，其余控制字符及不可见格式字符直接移除
+_EXCEL_TRANS = dict.fromkeys(
+    [*range(0x00, 0x09), 0x0B, 0x0C, *range(0x0E, 0x20), 0x7F,
+     0x00AD, 0x180E, *range(0x200B, 0x200E), 0xFEFF, *range(0x202A, 0x202F)]
+)
+_EXCEL_TRANS.update(str.maketrans({'\n': ' ', '\r': ' ', '\t': ' '}))
+
+# 路径校验：URL 前缀（只需对前缀长度的部分转小写）、Windows 非法字符，以及 Windows 绝对路径（盘符根路径或 UNC 路径）
+_URL_PREFIXES = ('http://', 'https://', 'ftp://', 'file://', 'mailto:', 'javascript:')
+_URL_PREFIX_MAX_LEN = max(map(len, _URL_PREFIXES))
+_WIN_ILLEGAL_CHARS = frozenset('<>:"|?*')
+# Windows 保留设备名（不区分大小写，带扩展名同样不可用）
+_WIN_RESERVED_NAMES = frozenset(
+    ['CON', 'PRN', 'AUX', 'NUL', *(f'COM{i}' for i in range(1, 10)), *(f'LPT{i}' for i in range(1, 10))]
+)
+_WIN_ABS_RE = re.compile(r'[A-Za-z]:[\\/]|[\\/]{2}[^\\/]+[\\/]+[^\\/]+')
+
+
+@lru_cache(maxsize=16384)
+def _clean_excel_text(text):
+    """
+    清理字符串，使其适合写入Excel（结果按输入缓存，模型输出中的类型、应用名称等大量重复）
+
+    Args:
+        text (str): 待清理的字符串
+
+    Returns:
+        str: 清理后的字符串
+    """
+    return text.translate(_EXCEL_TRANS)
+
+
+def _clean_excel_value(value):
+    """
+    清理字符串，使其适合写入Excel
+
+    Args:
+        value: 待清理的值
+
+    Returns:
+        清理后的字符串，非字符串原样返回
+    """
+    if isinstance(value, str):
+        return _clean_excel_text(value)
+    return value
+
+
+@lru_cache(maxsize=16384)
+def _filter_ignored_keys(filter_str, ignored_columns):
+    """
+    从过滤条件字符串中移除被忽略的键值对（结果按参数缓存）
+
+    Args:
+        filter_str (str): 原始过滤条件字符串
+        ignored_columns (frozenset): 要忽略的列名集合
+
+    Returns:
+        str: 过滤后的字符串，如果全部被过滤则返回空字符串
+    """
+    # 先按 "and" 分割各个条件：空白都是单个普通空格时分隔符只能是 " and "，直接按字面值分割，否则用正则
+    if '  ' not in filter_str and filter_str.isprintable():
+        conditions = filter_str.split(' and ')
+    else:
+        conditions = _AND_SPLIT_RE.split(filter_str)
+    
+    # 存储未被忽略的条件
+    remaining_conditions = []
+    
+    # 检查每个条件
+    for condition in conditions:
+        # 识别 "key = value" 格式：'=' 前有键名且其后有非空白的值
+        key, sep, value = condition.partition('=')
+        key = key.strip()
+        if sep and key and value and not value.isspace():
+            # 如果键不在忽略列表中，则保留该条件
+            if key not in ignored_columns:
+                remaining_conditions.append(condition)
+        else:
+            # 如果不匹配key=value格式，保留原样
+            remaining_conditions.append(condition)
+    
+    # 重新组合条件
+    return " and ".join(remaining_conditions) if remaining_conditions else ""
+
+
+# 结果中的固定占位文本，在模块加载时清理一次
+_NO_PATH = _clean_excel_value("<无路径>")
+_NO_FILE = _clean_excel_value("<无文件名>")
+_NO_APP = _clean_excel_value("<无>")
+_UNKNOWN_TYPE = "未知"
+
+
+def _strip_json_fence(text):
+    """
+    移除模型响应开头的 "```json"/"json" 标记与结尾的 "```"（只对开头几个字符转小写比较，不使用正则）
+
+    Args:
+        text (str): 模型响应
+
+    Returns:
+        str: 移除标记后的文本
+    """
+    if text.startswith('```'):
+        rest = text[3:].lstrip()
+        if rest[:4].lower() == 'json':
+            text = rest[4:].lstrip()
+    elif text[:4].lower() == 'json':
+        text = text[4:].lstrip()
+    if text.endswith('```'):
+        text = text[:-3].rstrip()
+    return text
+
+
+def _json_span_end(text, start):
+    """
+    从 start 处的开始符起按括号深度扫描，找到与之配对的结束符（忽略字符串中的括号）
+
+    Args:
+        text (str): 模型响应文本
+        start (int): 开始符 '{' 或 '[' 的位置
+
+    Returns:
+        int: 配对结束符之后的位置，括号不完整时返回None
+    """
+    depth = 0
+    pos = start
+    while True:
+        m = _JSON_STRUCT_RE.search(text, pos)
+        if m is None:
+            return None
+        ch = m.group()
+        if ch == '"':
+            # 整个字符串一次跳过
+            m = _JSON_STRING_TAIL_RE.match(text, m.end())
+            if m is None:
+                return None
+        elif ch in '{[':
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return m.end()
+        pos = m.end()
+
+
+def _extract_json_data(text):
+    """
+    快速解析模型响应中的 JSON：直接截取第一个开始符到最后一个配对结束符之间的内容，
+    代码块标记等都在该范围之外，无需先清洗；JSON 之后还有多余内容（如另一段 JSON 或说明文字）时，
+    只截取与开始符配对的部分
+
+    Args:
+        text (str): 去除首尾空白后的模型响应
+
+    Returns:
+        解析出的 JSON 数据，无法解析时返回None
+    """
+    start = _JSON_OPEN_RE.search(text)
+    if start is None:
+        return None
+    start_pos = start.start()
+    end = _JSON_LAST_CLOSE_RE.match(text, start_pos)
+    if end is not None and _JSON_PAIRS[text[start_pos]] == text[end.end() - 1]:
+        try:
+            return _json_loads(text[start_pos:end.end()])
+        except json.JSONDecodeError:
+            pass
+    end_pos = _json_span_end(text, start_pos)
+    if end_pos is None:
+        return None
+    try:
+        return _json_loads(text[start_pos:end_pos])
+    except json.JSONDecodeError:
+        return None
+
+
+def _prompt_cache_key(prompt):
+    """
+    计算提示词结果缓存的键
+
+    Args:
+        prompt (str): 发送给模型的提示词
+
+    Returns:
+        bytes: 提示词摘要
+    """
+    return hashlib.sha1(prompt.encode("utf-8")).digest()
+
+
+def _row_as_dict(row):
+    """
+    将数据行转换为字典，已是字典时直接返回
+
+    Args:
+        row: pd.Series 或 dict
+
+    Returns:
+        dict: 行数据
+    """
+    return row if isinstance(row, dict) else row.to_dict()
+
+
+def _output_record(row_number, input_text, item):
+    """
+    将模型返回的单个结果对象转换为输出记录，缺失字段直接使用已清理的占位文本
+
+    Args:
+        row_number (int): 行号
+        input_text (str): 模型输入文本
+        item (dict): 模型返回的结果对象
+
+    Returns:
+        dict: 输出记录
+    """
+    return {
+        "序号": row_number,
+        "输入内容": input_text,
+        "原始路径": _clean_excel_value(item["path"]) if "path" in item else _NO_PATH,
+        "文件名": _clean_excel_value(item["filename"]) if "filename" in item else _NO_FILE,
+        "类型": _clean_excel_value(item["type"]) if "type" in item else _UNKNOWN_TYPE,
+        "应用名称": _clean_excel_value(item["app"]) if "app" in item else _NO_APP
+    }
+
+
+def _error_record(row_number, input_text, message):
+    """
+    构造处理失败时的结果记录，错误信息写入原始路径列
+
+    Args:
+        row_number (int): 行号
+        input_text (str): 输入内容
+        message (str): 错误信息
+
+    Returns:
+        dict: 结果记录
+    """
+    return {
+        "序号": row_number,
+        "输入内容": input_text,
+        "原始路径": _clean_excel_value(message),
+        "文件名": _NO_FILE,
+        "类型": _UNKNOWN_TYPE,
+        "应用名称": _NO_APP
+    }
+
+# 路径特征：路径分隔符或常见可执行/脚本文件扩展名
+_PATH_HINT_RE = re.compile(r'[\\/]|\.(?:exe|dll|bat|ps1|cmd|sh|py|jar|scr|vbs)\b', re.IGNORECASE)
+
+# 快速提取：形如 path = "..." / 文件名 = "..." 的明确键值对
+_FAST_PATH_RE = re.compile(r'(?:\b(?:path|filename)|程序路径|文件名)\s*=\s*"(?P<val>[^"]+)"', re.IGNORECASE)
+# 快速提取的值以文件扩展名结尾才视为明确的路径
+_FAST_EXT_RE = re.compile(r'\.[A-Za-z0-9]{1,8}$')
+# 值中含正则元字符时需要模型还原，不走快速提取
+_REGEX_META_CHARS = frozenset('()[]{}*+?|^$')
+
+# 发送给模型的提示词前缀
+_PROMPT_PREFIX = "请从以下安全告警内容中提取所有程序路径、文件名，并分类输出：\n"
+# 多行合并为一次请求时的提示词前缀，各行按 "1) ..." 编号逐行列出
+_GROUP_PROMPT_PREFIX = (
+    "以下是{count}条安全告警内容，请分别从每一条中提取所有程序路径、文件名并分类，"
+    "每一条的结果为一个JSON数组，最外层输出长度为{count}的数组，顺序与编号一致：\n"
+)
+# 多行合并请求时追加到系统提示词末尾，覆盖其中“输出扁平对象数组”的格式要求
+_GROUP_SYSTEM_SUFFIX = (
+    "\n【多行模式】本次输入包含多条按编号列出的告警，上述输出格式调整为："
+    "最外层输出一个JSON数组，长度等于告警条数，顺序与编号一致；"
+    "其中每个元素是对应告警按上述规则输出的对象数组，该条没有结果时为空数组 []。"
+    "示例：[[{\"path\":\"/bin/bash\",\"filename\":\"bash\",\"type\":\"系统命令\",\"app\":\"bash\"}],[]]"
+)
+
 
 class WhiteAlarmProcessor:
     """
@@ -25,9 +317,24 @@ class WhiteAlarmProcessor:
         self.config_manager = config_manager
         self.logger = logger or logging.getLogger(__name__)
         self.ollama_client = None
+        # 后台预加载模型的线程（见 start_warmup），close 时等待其结束
+        self._warmup_thread = None
+        # 相同提示词的解析结果缓存（LRU），值不含行相关字段
+        self._result_cache = OrderedDict()
+        # 多线程并发处理时保护结果缓存与客户端的延迟创建
+        self._lock = threading.Lock()
+        self._result_cache_size = config_manager.get("processing.prompt_cache_size", 1024) or 0
+        # 不含任何路径特征的行是否跳过模型调用（默认关闭，开启后可能漏掉模型能推断出的路径）
+        self._skip_without_path_hint = bool(config_manager.get("processing.skip_rows_without_path_hint", False))
+        # 含明确路径键值对的行直接提取结果，不调用模型（默认关闭，提取结果不含类型和应用名称）
+        self._fast_path_extract = bool(config_manager.get("processing.fast_path_extract", False))
         
         # 从配置中获取必要参数
         self.system_prompt = config_manager.get("system_prompt", "").rstrip()
+        # 多行合并请求使用的系统提示词，未配置时在 system_prompt 后追加多行模式的输出格式说明
+        self.group_system_prompt = (config_manager.get("group_system_prompt", "") or "").rstrip() or (
+            self.system_prompt + _GROUP_SYSTEM_SUFFIX
+        )
         self.ollama_config = config_manager.get_ollama_config()
         
     def _get_ollama_client(self):
@@ -38,12 +345,76 @@ class WhiteAlarmProcessor:
             OllamaClient: Ollama客户端实例
         """
         if self.ollama_client is None:
-            self.ollama_client = create_ollama_client_from_config(
-                {"ollama": self.ollama_config}, 
-                logger=self.logger
-            )
+            with self._lock:
+                if self.ollama_client is None:
+                    self.ollama_client = create_ollama_client_from_config(
+                        {"ollama": self.ollama_config, "processing": self.config_manager.get("processing", {})},
+                        logger=self.logger,
+                        system_prompt=self.system_prompt
+                    )
         return self.ollama_client
+
+    def warmup(self):
+        """
+        预加载模型，可在读取数据的同时在后台调用，使第一行不必等待模型加载
+
+        Returns:
+            bool: 是否成功
+        """
+        # 在后台线程中运行，创建客户端失败（如配置缺失）也只记录警告，不影响任务
+        try:
+            return self._get_ollama_client().warmup()
+        except Exception as e:
+            self.logger.warning("模型预加载失败: %s", e)
+            return False
+
+    def start_warmup(self):
+        """
+        在后台线程中预加载模型（可与读取数据同时进行），close 时会等待该线程结束
+        """
+        self._warmup_thread = threading.Thread(target=self.warmup, name="ollama-warmup", daemon=True)
+        self._warmup_thread.start()
+
+    def close(self):
+        """
+        释放Ollama客户端持有的连接（先等待后台预加载结束，避免其使用已关闭的客户端）
+        """
+        if self._warmup_thread is not None:
+            self._warmup_thread.join()
+            self._warmup_thread = None
+        if self.ollama_client is not None:
+            self.ollama_client.close()
+            self.ollama_client = None
+        
+    def _clean_json_text(self, text):
+        """
+        清洗模型响应，截取其中的 JSON 部分
+
+        Args:
+            text (str): 去除首尾空白后的模型响应
+
+        Returns:
+            str: 清洗后的文本
+        """
+        # 1-2. 移除开头的 "json" 或 "```json" 等标记以及结尾的 "```"
+        cleaned_text = _strip_json_fence(text)
+        
+        # 3. 找到 JSON 开始位置（第一个 '{' 或 '['），找不到时没有可截取的内容
+        start = _JSON_OPEN_RE.search(cleaned_text)
+        if start is None:
+            return cleaned_text.strip()
+        start_pos = start.start()
+
+        # 4. 确保 JSON 完整性：截取到最后一个结束符（'}' 或 ']'），且须与开头符号配对
+        end = _JSON_LAST_CLOSE_RE.match(cleaned_text, start_pos)
+        if end is not None and _JSON_PAIRS[cleaned_text[start_pos]] == cleaned_text[end.end() - 1]:
+            cleaned_text = cleaned_text[start_pos:end.end()]
+        else:
+            cleaned_text = cleaned_text[start_pos:]
         
+        cleaned_text = cleaned_text.strip()
+        return cleaned_text
+
     def _call_ollama_model(self, input_text, row_number, task_logger):
         """
         调用Ollama模型处理输入文本
@@ -56,219 +427,409 @@ class WhiteAlarmProcessor:
         Returns:
             list: 处理结果列表
         """
-        task_logger.debug({"event": "ollama_input", "input": input_text})
+        if task_logger.isEnabledFor(logging.DEBUG):
+            task_logger.debug({"event": "ollama_input", "input": input_text})
+
+        cache_key = _prompt_cache_key(input_text)
+        cached = self._get_cached_result(cache_key, input_text, row_number, task_logger)
+        if cached is not None:
+            return cached
 
         # 使用Ollama客户端
         client = self._get_ollama_client()
         success, result_text, metadata = client.call_model(
             prompt=input_text,
-            system_prompt=self.system_prompt,
             temperature=0.0,
             num_predict=self.ollama_config.get('num_predict', 500),
-            task_id=f"task_{row_number}"
+            row_number=row_number
         )
+        outputs, parsed = self._parse_model_result(success, result_text, metadata, input_text, row_number, task_logger)
+        # 只缓存成功解析的结果，调用失败或响应不完整时相同输入的行仍会重新调用模型
+        if parsed:
+            self._store_cached_result(cache_key, outputs)
+        return outputs
+
+    def _get_cached_result(self, cache_key, input_text, row_number, task_logger):
+        """
+        查询提示词结果缓存，命中时为当前行重新填写序号和输入内容
+
+        Args:
+            cache_key (bytes): 提示词摘要
+            input_text (str): 输入文本
+            row_number (int): 行号
+            task_logger: 任务日志记录器
+
+        Returns:
+            list: 处理结果列表，未命中返回None
+        """
+        with self._lock:
+            template = self._result_cache.get(cache_key)
+            if template is None:
+                return None
+            self._result_cache.move_to_end(cache_key)
+        if task_logger.isEnabledFor(logging.DEBUG):
+            task_logger.debug({"event": "prompt_cache_hit", "results": len(template)})
+        return [{"序号": row_number, "输入内容": input_text, **item} for item in template]
+
+    def _store_cached_result(self, cache_key, outputs):
+        """
+        缓存解析结果（去掉行相关字段），超出容量时淘汰最久未使用的条目
+
+        Args:
+            cache_key (bytes): 提示词摘要
+            outputs (list): 处理结果列表
+        """
+        if self._result_cache_size <= 0:
+            return
+        template = [{k: v for k, v in item.items() if k not in ("序号", "输入内容")} for item in outputs]
+        with self._lock:
+            self._result_cache[cache_key] = template
+            self._result_cache.move_to_end(cache_key)
+            while len(self._result_cache) > self._result_cache_size:
+                self._result_cache.popitem(last=False)
 
+    def _parse_model_result(self, success, result_text, metadata, input_text, row_number, task_logger):
+        """
+        解析模型响应为结果列表
+
+        Args:
+            success (bool): 调用是否成功
+            result_text (str): 模型响应文本
+            metadata (dict): 调用元数据
+            input_text (str): 输入文本
+            row_number (int): 行号
+            task_logger: 任务日志记录器
+
+        Returns:
+            tuple: (处理结果列表, 响应是否成功解析)，调用失败或解析失败时结果为错误记录
+        """
         if not success:
             error_msg = metadata.get('error', 'Unknown error')
             task_logger.warning({"event": "ollama_call_failed", "error": error_msg})
-            return [{
-                "序号": row_number,
-                "输入内容": input_text,
-                "原始路径": self._clean_excel_string(f"<调用失败: {error_msg}>"),
-                "文件名": self._clean_excel_string("<无文件名>"),
-                "类型": "未知",
-                "应用名称": self._clean_excel_string("<无>")
-            }]
-
-        # --- 🔧 新增：增强 JSON 清洗逻辑 ---
-        cleaned_text = result_text.strip()
-        
-        # 记录原始响应和清洗前的文本
-        task_logger.debug({"event": "raw_model_response", "response": result_text})
-        
-        # 1. 移除开头的 "json" 或 "```json" 等标记
-        cleaned_text = re.sub(r'^```json\s*', '', cleaned_text)
-        cleaned_text = re.sub(r'^```\s*json\s*', '', cleaned_text)
-        cleaned_text = re.sub(r'^json\s*', '', cleaned_text, flags=re.IGNORECASE)
-        
-        # 2. 移除结尾的 "```"
-        cleaned_text = re.sub(r'\s*```$', '', cleaned_text)
-        
-        # 3. 找到 JSON 开始位置（第一个 '{' 或 '['）
-        start_brace = cleaned_text.find('{')
-        start_bracket = cleaned_text.find('[')
-        start_pos = min(start_brace if start_brace != -1 else float('inf'), 
-                       start_bracket if start_bracket != -1 else float('inf'))
-        if start_pos != float('inf'):
-            cleaned_text = cleaned_text[int(start_pos):]
-        else:
-            # 如果找不到开始符号，尝试从第一个字母开始找对象或数组
-            cleaned_text = cleaned_text.lstrip()
-        
-        # 4. 确保 JSON 完整性
-        # 检查开头是否为合法的JSON开始符
-        if cleaned_text.startswith(('{', '[')):
-            # 尝试从后往前找到结束符号
-            last_brace = cleaned_text.rfind('}')
-            last_bracket = cleaned_text.rfind(']')
-            end_pos = max(last_brace, last_bracket)
-            
-            # 确保结束符存在且位置合理
-            if end_pos != -1 and end_pos > 0:
-                # 根据开头符号确定应该查找的结束符号
-                if cleaned_text.startswith('{') and cleaned_text[end_pos] == '}':
-                    cleaned_text = cleaned_text[:end_pos + 1]
-                elif cleaned_text.startswith('[') and cleaned_text[end_pos] == ']':
-                    cleaned_text = cleaned_text[:end_pos + 1]
-        
-        cleaned_text = cleaned_text.strip()
-        
-        # 记录清洗后的文本
-        task_logger.debug({"event": "cleaned_model_response", "response": cleaned_text})
-        
-        # --- END JSON 清洗 ---
+            return [_error_record(row_number, input_text, f"<调用失败: {error_msg}>")], False
 
-        # 增强的JSON解析逻辑
-        try:
-            # 在解析前检查基本完整性
-            if not cleaned_text:
-                raise ValueError("Cleaned response is empty")
+        # 快速路径解析失败再走完整的清洗流程以记录详细错误
+        stripped = result_text.strip()
+        data = _extract_json_data(stripped)
+
+        if data is None:
+            _dbg = task_logger.isEnabledFor(logging.DEBUG)
+            # 记录原始响应
+            if _dbg:
+                task_logger.debug({"event": "raw_model_response", "response": result_text})
+            cleaned_text = self._clean_json_text(stripped)
+            # 记录清洗后的文本
+            if _dbg:
+                task_logger.debug({"event": "cleaned_model_response", "response": cleaned_text})
+
+            # 增强的JSON解析逻辑
+            try:
+                # 在解析前检查基本完整性
+                if not cleaned_text:
+                    raise ValueError("Cleaned response is empty")
             
-            # 检查是否以合法的JSON开始和结束字符开头和结尾
-            if not (cleaned_text.startswith(('{', '[')) and cleaned_text.endswith(('}', ']'))):
-                raise ValueError("Response doesn't start/end with valid JSON delimiters")
+                # 检查是否以合法的JSON开始和结束字符开头和结尾
+                if not (cleaned_text.startswith(('{', '[')) and cleaned_text.endswith(('}', ']'))):
+                    raise ValueError("Response doesn't start/end with valid JSON delimiters")
             
-            data = json.loads(cleaned_text)
-        except json.JSONDecodeError as e:
-            # 如果还是失败，记录更详细的调试信息
-            task_logger.warning({
-                "event": "json_parse_failed",
-                "error": str(e),
-                "cleaned_response": repr(cleaned_text),
-                "original_response_snippet": result_text[:500]  # 记录更多上下文
-            })
-            return [{
-                "序号": row_number,
-                "输入内容": input_text,
-                "原始路径": self._clean_excel_string(f"<JSON解析失败: {str(e)[:100]}>"),
-                "文件名": self._clean_excel_string("<无文件名>"),
-                "类型": "未知",
-                "应用名称": self._clean_excel_string("<无>")
-            }]
-        except ValueError as e:
-            # 处理自定义验证错误
-            task_logger.warning({
-                "event": "json_validation_failed",
-                "error": str(e),
-                "cleaned_response": repr(cleaned_text),
-                "original_response_snippet": result_text[:500]
-            })
-            return [{
-                "序号": row_number,
-                "输入内容": input_text,
-                "原始路径": self._clean_excel_string(f"<JSON验证失败: {str(e)[:100]}>"),
-                "文件名": self._clean_excel_string("<无文件名>"),
-                "类型": "未知",
-                "应用名称": self._clean_excel_string("<无>")
-            }]
+                data = _json_loads(cleaned_text)
+            except json.JSONDecodeError as e:
+                # 如果还是失败，记录更详细的调试信息
+                task_logger.warning({
+                    "event": "json_parse_failed",
+                    "error": str(e),
+                    "cleaned_response": repr(cleaned_text),
+                    "original_response_snippet": result_text[:500]  # 记录更多上下文
+                })
+                return [_error_record(row_number, input_text, f"<JSON解析失败: {str(e)[:100]}>")], False
+            except ValueError as e:
+                # 处理自定义验证错误
+                task_logger.warning({
+                    "event": "json_validation_failed",
+                    "error": str(e),
+                    "cleaned_response": repr(cleaned_text),
+                    "original_response_snippet": result_text[:500]
+                })
+                return [_error_record(row_number, input_text, f"<JSON验证失败: {str(e)[:100]}>")], False
 
         final_outputs = []
         if isinstance(data, list):
-            for i, item in enumerate(data, 1):  # 从1开始编号
+            for item in data:
                 if isinstance(item, dict):
-                    path = self._clean_excel_string(item.get("path", "<无路径>"))
-                    filename = self._clean_excel_string(item.get("filename", "<无文件名>"))
-                    typ = self._clean_excel_string(item.get("type", "未知"))
-                    app = self._clean_excel_string(item.get("app", "<无>"))
-                    
-                    final_outputs.append({
-                        "序号": row_number,
-                        "输入内容": input_text,
-                        "原始路径": path,
-                        "文件名": filename,
-                        "类型": typ,
-                        "应用名称": app
-                    })
+                    final_outputs.append(_output_record(row_number, input_text, item))
         elif isinstance(data, dict):
-            path = self._clean_excel_string(data.get("path", "<无路径>"))
-            filename = self._clean_excel_string(data.get("filename", "<无文件名>"))
-            typ = self._clean_excel_string(data.get("type", "未知"))
-            app = self._clean_excel_string(data.get("app", "<无>"))
-            
-            final_outputs.append({
-                "序号": row_number,
-                "输入内容": input_text,
-                "原始路径": path,
-                "文件名": filename,
-                "类型": typ,
-                "应用名称": app
-            })
-
-        return final_outputs
+            final_outputs.append(_output_record(row_number, input_text, data))
+
+        return final_outputs, True
         
     def process_row(self, row, idx, selected_columns=None, ignored_columns=None, task_logger=None):
         """
         处理单行数据
         
         Args:
-            row: 数据行
+            row: 数据行（pd.Series 或 dict）
             idx (int): 行索引
             selected_columns (list): 选中的列
-            ignored_columns (list): 忽略的列
+            ignored_columns (frozenset): 忽略的列
             task_logger: 任务日志记录器
             
         Returns:
             dict: 处理结果
         """
         original_index = idx + 1
-        row_dict = row.to_dict()
-
-        input_text = ""
-
-        # 如果用户指定了选择的列，则使用用户指定的列
-        if selected_columns is not None and len(selected_columns) > 0:
-            parts = []
-            # 只使用用户选定的列
-            for col in selected_columns:
-                val = row_dict.get(col)
-                if pd.notna(val) and str(val).strip():
-                    # 检查是否整个列被忽略
-                    if col in ignored_columns:
-                        task_logger.debug(f"[task_{original_index}] 列 '{col}' 被用户忽略，跳过处理")
-                        continue
-                    # 处理所有列
-                    # 如果有需要忽略的键值对，尝试解析并过滤
-                    filtered_val = str(val).strip()
-                    if ignored_columns:
-                        # 尝试解析当前列是否为键值对格式，如果是则过滤
-                        filtered_val = self._filter_ignored_keys_from_filter_condition(str(val).strip(), ignored_columns)
-                    
-                    # 如果过滤后还有内容则添加
-                    if filtered_val:
-                        parts.append(filtered_val)
-                        # task_logger.debug(f"添加列 '{col}' 的内容: {repr(filtered_val)}")
-                    else:
-                        task_logger.debug(f"列 '{col}' 过滤后无内容，跳过添加")
-            
-            input_text = " ; ".join(parts)
-            task_logger.debug(f"最终拼接的输入文本: {repr(input_text)}")
-        else:
-            # 如果用户没有在页面上选择特定的列，则返回错误提示，要求用户至少选择一列
-            task_logger.debug(f"用户未选择任何列，无法处理")
+
+        # 如果用户没有在页面上选择特定的列，则返回错误提示，要求用户至少选择一列
+        if selected_columns is None or len(selected_columns) == 0:
+            task_logger.debug("用户未选择任何列，无法处理")
             return {
                 "type": "no_path_found",
-                "row": row_dict,
+                "row": _row_as_dict(row),
                 "error": "用户未选择任何列，请至少选择一列进行处理"
             }
-            
+        # 只读取选中的列，不将整行转换为字典；忽略列转换为 frozenset（已是 frozenset 时不复制）以便 O(1) 查询
+        ignored_columns = frozenset(ignored_columns or ())
+        input_text = self._build_input_text(row, original_index, selected_columns, ignored_columns, task_logger)
+        if self._lacks_path_hint(input_text, task_logger):
+            return self._no_path_hint_result(_row_as_dict(row))
+        return self.process_prepared(input_text, original_index, task_logger)
+
+    def prepare_inputs(self, df, selected_columns, ignored_columns=None):
+        """
+        按列批量拼接所有行的模型输入文本，结果与逐行调用 process_row 时的拼接一致
+
+        Args:
+            df (pd.DataFrame): 待处理数据
+            selected_columns (list): 选中的列
+            ignored_columns (frozenset): 忽略的列
+
+        Returns:
+            pd.Series: 与 df 索引对齐的输入文本
+        """
+        ignored_columns = frozenset(ignored_columns or ())
+        input_texts = pd.Series("", index=df.index, dtype=object)
+        for col in selected_columns:
+            # 整列被忽略或不存在的列直接跳过
+            if col in ignored_columns or col not in df.columns:
+                continue
+            series = df[col]
+            # 文本列可直接整列转换；其他类型逐个 str() 以保持与逐行处理相同的格式
+            text = series.astype(str) if series.dtype == object else series.map(str)
+            text = text.str.strip()
+            if ignored_columns:
+                text = text.map(lambda v: self._filter_ignored_keys_from_filter_condition(v, ignored_columns))
+            # 空值、空白以及过滤后为空的单元格不参与拼接
+            mask = series.notna() & (text != "")
+            first = mask & (input_texts == "")
+            input_texts = input_texts.mask(mask & ~first, input_texts + " ; " + text).mask(first, text)
+        return input_texts
+
+    def process_prepared(self, input_text, row_number, task_logger):
+        """
+        处理已拼接好输入文本的单行数据
+
+        Args:
+            input_text (str): 输入文本（见 prepare_inputs）
+            row_number (int): 行号（从1开始）
+            task_logger: 任务日志记录器
+
+        Returns:
+            dict: 处理结果
+        """
+        if self._lacks_path_hint(input_text, task_logger):
+            return self._no_path_hint_result(input_text)
+
         # 直接将清理后的内容交给 Ollama
-        desc = "请从以下安全告警内容中提取所有程序路径、文件名，并分类输出：\n" + input_text
+        desc = _PROMPT_PREFIX + input_text
+        fast_results = self.try_fast_extract(input_text, desc, row_number)
+        if fast_results is not None:
+            task_logger.debug("输入内容含明确路径，跳过模型调用")
+            return {"type": "processed", "outputs": fast_results}
+
         # task_logger.debug(f"发送请求到 Ollama: {repr(desc)}")
-        parsed_results = self._call_ollama_model(desc, original_index, task_logger)
+        parsed_results = self._call_ollama_model(desc, row_number, task_logger)
         
-        task_logger.debug(f"Ollama 处理完成，返回结果数: {len(parsed_results)}")
+        if task_logger.isEnabledFor(logging.DEBUG):
+            task_logger.debug(f"Ollama 处理完成，返回结果数: {len(parsed_results)}")
 
         return {"type": "processed", "outputs": parsed_results}
+
+    def process_prepared_group(self, items, task_logger):
+        """
+        将多行已拼接好的输入文本合并为一次模型请求处理，减少重复处理系统提示词的开销
+
+        跳过模型调用、快速提取及缓存命中的行不参与合并；模型返回的最外层数组长度与行数不一致，
+        或其中任一元素不是数组时，整组逐行重新处理
+
+        Args:
+            items (list): (输入文本, 行号) 列表
+            task_logger: 任务日志记录器
+
+        Returns:
+            list: 与 items 顺序一致的处理结果（格式同 process_prepared）
+        """
+        results = [None] * len(items)
+        pending = []
+        for pos, (input_text, row_number) in enumerate(items):
+            if self._lacks_path_hint(input_text, task_logger):
+                results[pos] = self._no_path_hint_result(input_text)
+                continue
+            desc = _PROMPT_PREFIX + input_text
+            outputs = self.try_fast_extract(input_text, desc, row_number)
+            if outputs is None:
+                outputs = self._get_cached_result(_prompt_cache_key(desc), desc, row_number, task_logger)
+            if outputs is not None:
+                results[pos] = {"type": "processed", "outputs": outputs}
+            else:
+                pending.append((pos, input_text, row_number, desc))
+
+        if len(pending) == 1:
+            pos, input_text, row_number, _ = pending[0]
+            results[pos] = self.process_prepared(input_text, row_number, task_logger)
+        elif pending:
+            prompt = _GROUP_PROMPT_PREFIX.format(count=len(pending)) + "\n".join(
+                f"{i}) {input_text}" for i, (_, input_text, _, _) in enumerate(pending, 1)
+            )
+            if task_logger.isEnabledFor(logging.DEBUG):
+                task_logger.debug({"event": "ollama_input", "input": prompt})
+            client = self._get_ollama_client()
+            success, result_text, metadata = client.call_model(
+                prompt=prompt,
+                system_prompt=self.group_system_prompt,
+                temperature=0.0,
+                num_predict=self.ollama_config.get('num_predict', 500) * len(pending),
+                row_number=pending[0][2]
+            )
+            if not success:
+                for pos, _, row_number, desc in pending:
+                    outputs, _ = self._parse_model_result(False, result_text, metadata, desc, row_number, task_logger)
+                    results[pos] = {"type": "processed", "outputs": outputs}
+                return results
+
+            data = _extract_json_data(result_text.strip())
+            # 每一行的结果必须是一个数组：模型按单行格式输出的扁平对象数组（即使长度恰好相同）
+            # 无法对应到各行，整组逐行重新处理
+            if (not isinstance(data, list) or len(data) != len(pending)
+                    or not all(isinstance(item_data, list) for item_data in data)):
+                task_logger.warning({
+                    "event": "group_result_mismatch",
+                    "rows": len(pending),
+                    "original_response_snippet": result_text[:500]
+                })
+                for pos, input_text, row_number, _ in pending:
+                    results[pos] = self.process_prepared(input_text, row_number, task_logger)
+                return results
+            for (pos, input_text, row_number, desc), item_data in zip(pending, data):
+                outputs = [_output_record(row_number, desc, item) for item in item_data if isinstance(item, dict)]
+                self._store_cached_result(_prompt_cache_key(desc), outputs)
+                results[pos] = {"type": "processed", "outputs": outputs}
+        return results
+
+    def try_fast_extract(self, input_text, desc, row_number):
+        """
+        从明确的路径键值对中直接提取结果（需在配置中开启 processing.fast_path_extract）
+
+        只有所有匹配值都是不含正则元字符、以扩展名结尾的路径时才返回结果，否则交给模型处理
+
+        Args:
+            input_text (str): 输入文本
+            desc (str): 发送给模型的完整提示（写入结果的输入内容）
+            row_number (int): 行号
+
+        Returns:
+            list: 与模型解析结果格式一致的结果列表，无法快速提取时返回None
+        """
+        if not self._fast_path_extract:
+            return None
+        values = [m.group('val').strip() for m in _FAST_PATH_RE.finditer(input_text)]
+        if not values:
+            return None
+        outputs = []
+        for value in values:
+            if '\\\\' in value or not _REGEX_META_CHARS.isdisjoint(value) or not _FAST_EXT_RE.search(value):
+                return None
+            filename = value.replace('\\', '/').rpartition('/')[2]
+            outputs.append(_output_record(row_number, desc, {"path": value, "filename": filename}))
+        return outputs
+
+    def _lacks_path_hint(self, input_text, task_logger):
+        """
+        判断输入文本是否不含任何路径特征（需在配置中开启 processing.skip_rows_without_path_hint）
+
+        Args:
+            input_text (str): 输入文本
+            task_logger: 任务日志记录器
+
+        Returns:
+            bool: 为True时可跳过模型调用
+        """
+        if not self._skip_without_path_hint or _PATH_HINT_RE.search(input_text):
+            return False
+        task_logger.debug("输入内容中未发现路径特征，跳过模型调用")
+        return True
+
+    def _no_path_hint_result(self, row):
+        """
+        构造跳过模型调用时的处理结果
+
+        Args:
+            row: 原始行数据（或输入文本）
+
+        Returns:
+            dict: 处理结果
+        """
+        return {
+            "type": "no_path_found",
+            "row": row,
+            "error": "输入内容中未发现路径特征，已跳过模型调用"
+        }
+
+    def _build_input_text(self, row_dict, original_index, selected_columns, ignored_columns, task_logger):
+        """
+        按用户选择的列拼接模型输入文本
+
+        Args:
+            row_dict: 行数据（dict 或 pd.Series，只通过 get 读取选中的列）
+            original_index (int): 行号（从1开始）
+            selected_columns (list): 选中的列
+            ignored_columns (frozenset): 忽略的列
+            task_logger: 任务日志记录器
+
+        Returns:
+            str: 拼接后的输入文本
+        """
+        _dbg = task_logger.isEnabledFor(logging.DEBUG)
+        parts = []
+        # 只使用用户选定的列
+        for col in selected_columns:
+            val = row_dict.get(col)
+            # 空值与空白单元格不参与拼接（每个单元格只转换、去空白一次）
+            if pd.isna(val):
+                continue
+            filtered_val = str(val).strip()
+            if not filtered_val:
+                continue
+            # 检查是否整个列被忽略
+            if col in ignored_columns:
+                if _dbg:
+                    task_logger.debug(f"[task_{original_index}] 列 '{col}' 被用户忽略，跳过处理")
+                continue
+            # 处理所有列
+            # 如果有需要忽略的键值对，尝试解析并过滤
+            if ignored_columns:
+                # 尝试解析当前列是否为键值对格式，如果是则过滤
+                filtered_val = self._filter_ignored_keys_from_filter_condition(filtered_val, ignored_columns)
+            
+            # 如果过滤后还有内容则添加
+            if filtered_val:
+                parts.append(filtered_val)
+                # task_logger.debug(f"添加列 '{col}' 的内容: {repr(filtered_val)}")
+            elif _dbg:
+                task_logger.debug(f"列 '{col}' 过滤后无内容，跳过添加")
+        
+        input_text = " ; ".join(parts)
+        if _dbg:
+            task_logger.debug(f"最终拼接的输入文本: {repr(input_text)}")
+        return input_text
         
     def is_valid_path(self, value, allow_filename_only=True):
         """
@@ -284,44 +845,41 @@ class WhiteAlarmProcessor:
         if not isinstance(value, str):
             return False
         # 拒绝 URL
-        if value.lower().startswith(('http://', 'https://', 'ftp://', 'file://', 'mailto:', 'javascript:')):
+        if value[:_URL_PREFIX_MAX_LEN].lower().startswith(_URL_PREFIXES):
             return False
         # 拒绝特殊标记
         if value.startswith('<') and value.endswith('>'):
             return False
-        try:
-            # 使用Pathlib来验证路径
-            path = Path(value)
-
-            # 检查路径是否包含非法字符（Windows特定）
-            if os.name == 'nt':  # Windows系统
-                illegal_chars = '<>:"|?*'
-                if any(char in value for char in illegal_chars):
-                    return False
-
-            # 如果允许文件名且不是绝对路径，则认为是有效的
-            if allow_filename_only and not path.is_absolute():
-                is_valid = len(value) <= 255
-                # 记录验证结果
-                if not is_valid:
-                    self.logger.debug(f"路径验证失败（文件名太长）: {repr(value)}")
-                return is_valid
-
-            # 对于绝对路径，检查基本格式
-            if path.is_absolute():
-                return True
-
-            # 尝试规范化路径，看是否有效
-            normalized = path.resolve()
-            is_valid = str(normalized) != '/'
+        # 检查路径是否包含非法字符（Windows特定）
+        if os.name == 'nt':  # Windows系统
+            if not _WIN_ILLEGAL_CHARS.isdisjoint(value):
+                return False
+            # 文件名为保留设备名（如 CON、NUL.txt）
+            name = value.replace('/', '\\').rpartition('\\')[2]
+            if name.partition('.')[0].rstrip(' ').upper() in _WIN_RESERVED_NAMES:
+                return False
+            is_absolute = _WIN_ABS_RE.match(value) is not None
+        else:
+            is_absolute = value.startswith('/')
+
+        # 如果允许文件名且不是绝对路径，则认为是有效的
+        if allow_filename_only and not is_absolute:
+            is_valid = len(value) <= 255
             # 记录验证结果
             if not is_valid:
-                self.logger.debug(f"路径验证失败（规范化后无效）: {repr(value)}")
+                self.logger.debug("路径验证失败（文件名太长）: %r", value)
             return is_valid
 
-        except Exception as e:
-            self.logger.debug(f"路径验证异常: {repr(value)}, 错误: {e}")
-            return False
+        # 对于绝对路径，检查基本格式
+        if is_absolute:
+            return True
+
+        # 相对路径只做长度检查，不访问文件系统
+        is_valid = 0 < len(value) <= 4096
+        # 记录验证结果
+        if not is_valid:
+            self.logger.debug("路径验证失败（长度无效）: %r", value)
+        return is_valid
             
     def _clean_excel_string(self, value):
         """
@@ -333,9 +891,7 @@ class WhiteAlarmProcessor:
         Returns:
             清理后的字符串
         """
-        if isinstance(value, str):
-            return value.replace("\n", " ").replace("\r", " ").replace("\t", " ")
-        return value
+        return _clean_excel_value(value)
         
     def _filter_ignored_keys_from_filter_condition(self, filter_str, ignored_columns):
         """
@@ -343,7 +899,7 @@ class WhiteAlarmProcessor:
         
         Args:
             filter_str (str): 原始过滤条件字符串
-            ignored_columns (list): 要忽略的列名列表
+            ignored_columns (frozenset): 要忽略的列名集合
             
         Returns:
             str: 过滤后的字符串，如果全部被过滤则返回空字符串
@@ -351,25 +907,7 @@ class WhiteAlarmProcessor:
         if not isinstance(filter_str, str) or not ignored_columns:
             return filter_str
         
-        # 先按 "and" 分割各个条件
-        conditions = re.split(r'\s+and\s+', filter_str)
-        
-        # 存储未被忽略的条件
-        remaining_conditions = []
-        
-        # 检查每个条件
-        for condition in conditions:
-            # 匹配 "key = value" 格式
-            pattern = r'^([^=]+?)\s*=\s*("[^"]*"|\'[^\']*\'|\S+)'
-            match = re.match(pattern, condition.strip())
-            if match:
-                key = match.group(1).strip()
-                # 如果键不在忽略列表中，则保留该条件
-                if key not in ignored_columns:
-                    remaining_conditions.append(condition)
-            else:
-                # 如果不匹配key=value格式，保留原样
-                remaining_conditions.append(condition)
-        
-        # 重新组合条件
-        return " and ".join(remaining_conditions) if remaining_conditions else ""
\ No newline at end of file
+        # 同一任务中的忽略列集合不变，重复出现的过滤条件直接命中缓存
+        if not isinstance(ignored_columns, frozenset):
+            ignored_columns = frozenset(ignored_columns)
+        return _filter_ignored_keys(filter_str, ignored_columns)